@@ -1,14 +1,16 @@
 import os
 import asyncio
+import json
 from datetime import datetime, timedelta
 from typing import Optional, List
 
 from backend.dal.database import db_helper
 from backend.utils.email_client import send_email
+from backend.websocket_manager import ws_manager
 
 CHECK_INTERVAL_SECONDS = int(os.getenv("ALERTS_CHECK_INTERVAL", "60"))
 
-async def _check_low_balance_and_notify() -> None:
+def _check_low_balance_and_notify() -> None:
     try:
         # Threshold can be absolute kWh or %; here treat as absolute kWh
         thr_env = os.getenv("LOW_BALANCE_THRESHOLD_KWH", "5")
@@ -38,7 +40,7 @@ async def _check_low_balance_and_notify() -> None:
         # Avoid crashing scheduler
         pass
 
-async def _check_offline_devices_and_notify() -> None:
+def _check_offline_devices_and_notify() -> None:
     try:
         # Determine poll interval to gauge offline threshold
         poll = 60
@@ -73,7 +75,7 @@ async def _check_offline_devices_and_notify() -> None:
     except Exception:
         pass
 
-async def _check_usage_threshold_and_notify() -> None:
+def _check_usage_threshold_and_notify() -> None:
     try:
         rows = db_helper.execute_query(
             """
@@ -125,7 +127,7 @@ async def _check_usage_threshold_and_notify() -> None:
                                     uid,
                                     'INFO' if ok else 'ERROR',
                                     '80% usage warning sent',
-                                    f'{'{'}"user_id": {uid}, "email_sent": {str(ok).lower()}{'}'}'
+                                    json.dumps({"user_id": uid, "email_sent": bool(ok)})
                                 )
                             )
                         except Exception:
@@ -191,7 +193,7 @@ async def _check_usage_threshold_and_notify() -> None:
                                 uid,
                                 'INFO' if ok2 else 'ERROR',
                                 '100% allocation exhausted',
-                                f'{'{'}"user_id": {uid}, "email_sent": {str(ok2).lower()}{'}'}'
+                                json.dumps({"user_id": uid, "email_sent": bool(ok2)})
                             )
                         )
                     except Exception:
@@ -217,8 +219,12 @@ async def start_alerts_scheduler():
     async def loop():
         while True:
             await asyncio.sleep(CHECK_INTERVAL_SECONDS)
-            await _check_usage_threshold_and_notify()
-            await _check_low_balance_and_notify()
-            await _check_offline_devices_and_notify()
-    # Start background loop
-    asyncio.create_task(loop())
+            if not await ws_manager.claim_periodic("alerts", max(1, CHECK_INTERVAL_SECONDS - 5)):
+                # Another worker runs this interval's checks
+                continue
+            # The checks do blocking DB queries and SMTP sends; run them off the event loop
+            await asyncio.to_thread(_check_usage_threshold_and_notify)
+            await asyncio.to_thread(_check_low_balance_and_notify)
+            await asyncio.to_thread(_check_offline_devices_and_notify)
+    # Start background loop (returned so the caller can cancel it on shutdown)
+    return asyncio.create_task(loop())
@@ -3,6 +3,7 @@ Admin API routes
 Handles administrative functions like user management, recharging, and system control.
 """
 
+import json
 from fastapi import APIRouter, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Dict, Any, Optional
@@ -374,7 +375,7 @@ async def recharge_user(user_id: int, request: RechargeRequest, current_user: Di
 
                 email = users[0].get("Email") if isinstance(users[0], dict) else None
                 if email:
-                    from backend.utils.email_client import send_email
+                    from backend.utils.email_client import send_email_async
                     subj = f"Recharge completed — new allocation: {allocated} kWh"
                     body = (
                         f"Dear {fullname},\n\n"
@@ -385,7 +386,7 @@ async def recharge_user(user_id: int, request: RechargeRequest, current_user: Di
                         f"You may now continue using the service. If you need assistance, please contact support@example.com.\n\n"
                         f"Warm regards,\nEnergy Monitoring System\n"
                     )
-                    send_email(subj, body, [email], html=False)
+                    await send_email_async(subj, body, [email], html=False)
             except Exception:
                 pass
             try:
@@ -393,14 +394,14 @@ async def recharge_user(user_id: int, request: RechargeRequest, current_user: Di
                     "INSERT INTO ops.Events (UserID, Level, EventType, Message, Source, MetaData, Timestamp) VALUES (?, 'INFO', 'usage_flags_reset', 'Usage flags reset after recharge', 'api', ?, GETUTCDATE())",
                     (
                         user_id,
-                        f'{'{'}"user_id": {user_id}, "amount": {request.amount}{'}'}'
+                        json.dumps({"user_id": user_id, "amount": float(request.amount)})
                     )
                 )
                 db_helper.execute_query(
                     "INSERT INTO ops.Events (UserID, Level, EventType, Message, Source, MetaData, Timestamp) VALUES (?, 'INFO', 'recharge', 'Recharge completed', 'api', ?, GETUTCDATE())",
                     (
                         user_id,
-                        f'{'{'}"user_id": {user_id}, "new_allocated": {allocated}, "used": {used}{'}'}'
+                        json.dumps({"user_id": user_id, "new_allocated": float(allocated or 0), "used": float(used or 0)})
                     )
                 )
             except Exception:
@@ -7,10 +7,14 @@ from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import base64
+import hashlib
+import hmac
+import json
 from jose import jwt
 from jose.exceptions import JWTError, ExpiredSignatureError
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 from typing import Dict, Any
 from pydantic import BaseModel, Field
 from dotenv import load_dotenv
@@ -36,6 +40,27 @@ else:
 REFRESH_SECRET = os.getenv("JWT_REFRESH_SECRET") or (JWT_SECRET + "_refresh" if JWT_SECRET else None)
 REFRESH_EXPIRATION_HOURS = int(os.getenv("JWT_REFRESH_EXPIRATION_HOURS", "240"))
 
+# HS256 tokens are signed here without going through jose: the header segment never
+# changes and each secret's HMAC state is keyed once, then copied per token.
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+_HEADER_B64 = _b64url(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+def _hmac_proto(secret):
+    if JWT_ALGORITHM != "HS256" or not secret:
+        return None
+    return hmac.new(secret.encode(), digestmod=hashlib.sha256)
+
+_HMAC_PROTO = _hmac_proto(JWT_SECRET)
+_REFRESH_HMAC_PROTO = _hmac_proto(REFRESH_SECRET)
+
+def _sign_hs256(payload: Dict[str, Any], proto) -> str:
+    signing_input = _HEADER_B64 + b"." + _b64url(json.dumps(payload, separators=(",", ":")).encode())
+    mac = proto.copy()
+    mac.update(signing_input)
+    return (signing_input + b"." + _b64url(mac.digest())).decode("ascii")
+
 router = APIRouter()
 security = HTTPBearer()
 
@@ -61,28 +86,30 @@ def verify_password(password: str, stored_password: str) -> bool:
 
 def create_jwt_token(user_id: int, username: str, role: str) -> str:
     """Create JWT token for authenticated user"""
-    expiration = datetime.utcnow() + timedelta(minutes=JWT_EXPIRATION_MINUTES)
-
+    now = int(time.time())
     payload = {
         "sub": str(user_id),
         "username": username,
         "role": role,
-        "exp": expiration,
-        "iat": datetime.utcnow()
+        "exp": now + JWT_EXPIRATION_MINUTES * 60,
+        "iat": now
     }
 
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
-    return token
+    if _HMAC_PROTO is not None:
+        return _sign_hs256(payload, _HMAC_PROTO)
+    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def create_refresh_token(user_id: int, username: str) -> str:
-    expiration = datetime.utcnow() + timedelta(hours=REFRESH_EXPIRATION_HOURS)
+    now = int(time.time())
     payload = {
         "sub": str(user_id),
         "username": username,
         "type": "refresh",
-        "exp": expiration,
-        "iat": datetime.utcnow(),
+        "exp": now + REFRESH_EXPIRATION_HOURS * 3600,
+        "iat": now,
     }
+    if _REFRESH_HMAC_PROTO is not None:
+        return _sign_hs256(payload, _REFRESH_HMAC_PROTO)
     return jwt.encode(payload, REFRESH_SECRET, algorithm=JWT_ALGORITHM)
 
 def decode_jwt_token(token: str) -> Dict[str, Any]:
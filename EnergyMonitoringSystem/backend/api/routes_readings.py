@@ -3,15 +3,19 @@ Energy readings API routes
 Handles retrieval of device readings and historical data.
 """
 
+import logging
 from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
+from math import isfinite
 from pydantic import BaseModel
 
 from backend.dal.database import db_helper
 from backend.api.routes_auth import get_current_user
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 security = HTTPBearer()
 
@@ -96,8 +100,8 @@ async def get_latest_readings(device_id: int, current_user: Dict = Depends(get_c
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Get latest readings error: {e}")
+    except Exception:
+        logger.exception("Get latest readings error")
         raise HTTPException(status_code=500, detail="Failed to retrieve latest readings")
 
 @router.get("/history/{device_id}")
@@ -155,8 +159,8 @@ async def get_reading_history(
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Get reading history error: {e}")
+    except Exception:
+        logger.exception("Get reading history error")
         raise HTTPException(status_code=500, detail="Failed to retrieve reading history")
 
 @router.get("/parameters")
@@ -191,8 +195,8 @@ async def get_parameters(current_user: Dict = Depends(get_current_user)):
             "parameters": param_defs
         }
 
-    except Exception as e:
-        print(f"Get parameters error: {e}")
+    except Exception:
+        logger.exception("Get parameters error")
         raise HTTPException(status_code=500, detail="Failed to retrieve parameters")
 
 @router.get("/summary/{device_id}")
@@ -246,8 +250,8 @@ async def get_device_summary(
 
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"Get device summary error: {e}")
+    except Exception:
+        logger.exception("Get device summary error")
         raise HTTPException(status_code=500, detail="Failed to retrieve device summary")
 
 @router.get("/realtime")
@@ -336,8 +340,8 @@ async def get_realtime_readings(current_user: Dict = Depends(get_current_user)):
             "timestamp": datetime.utcnow()
         }
 
-    except Exception as e:
-        print(f"Get realtime readings error: {e}")
+    except Exception:
+        logger.exception("Get realtime readings error")
         raise HTTPException(status_code=500, detail="Failed to retrieve realtime readings")
 
 @router.get("/realtime/v2")
@@ -404,11 +408,8 @@ async def get_realtime_readings_v2(current_user: Dict = Depends(get_current_user
                     def push(code, unit, val):
                         if val is None:
                             return
-                        try:
-                            v = float(val)
-                            if v != v or v == float("inf") or v == float("-inf"):
-                                return
-                        except Exception:
+                        v = float(val)
+                        if not isfinite(v):
                             return
                         readings.append({
                             "name": code,
@@ -417,14 +418,12 @@ async def get_realtime_readings_v2(current_user: Dict = Depends(get_current_user
                             "value": v
                         })
                     pf_val = rr.get("PF_Avg")
-                    try:
-                        kw = float(rr.get("KW_Total") or 0)
-                        it = float(rr.get("ITotal") or 0)
+                    if not pf_val:
+                        # Idle but energised line: report unity PF instead of 0/NULL.
+                        # VL1 > 100 is the common case, so test it first.
                         v1 = float(rr.get("VL1") or 0)
-                        if (pf_val is None or float(pf_val) == 0.0) and kw < 0.001 and it < 0.01 and v1 > 100.0:
+                        if v1 > 100.0 and float(rr.get("KW_Total") or 0) < 0.001 and float(rr.get("ITotal") or 0) < 0.01:
                             pf_val = 1.0
-                    except Exception:
-                        pass
 
                     # Map DB columns to frontend parameter codes
                     push("power_kw_total", "kW", rr.get("KW_Total"))
@@ -458,6 +457,6 @@ async def get_realtime_readings_v2(current_user: Dict = Depends(get_current_user
             "timestamp": datetime.utcnow()
         }
 
-    except Exception as e:
-        print(f"Get realtime readings v2 error: {e}")
+    except Exception:
+        logger.exception("Get realtime readings v2 error")
         raise HTTPException(status_code=500, detail="Failed to retrieve realtime readings v2")
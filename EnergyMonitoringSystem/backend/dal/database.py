@@ -3,23 +3,44 @@ Database connection and operations for Prepaid Energy Monitoring System
 Handles SQL Server connections via ODBC and stored procedure execution.
 """
 
-try:
-    import pyodbc
-except ImportError:
-    pyodbc = None
-    print("WARNING: pyodbc not available. Database operations will fail. Install Microsoft C++ Build Tools from https://visualstudio.microsoft.com/visual-cpp-build-tools/ and run: pip install pyodbc")
+import logging
 import os
+import queue
+import threading
+import time
 from dotenv import load_dotenv
 from pathlib import Path
 from typing import Optional, Dict, Any, List
 from contextlib import contextmanager
 
+logger = logging.getLogger(__name__)
+
+try:
+    import pyodbc
+except ImportError:
+    pyodbc = None
+    logger.warning("pyodbc not available. Database operations will fail. Install Microsoft C++ Build Tools from https://visualstudio.microsoft.com/visual-cpp-build-tools/ and run: pip install pyodbc")
+
 try:
     env_path = Path(__file__).resolve().parents[3] / ".env"
     load_dotenv(dotenv_path=str(env_path))
 except Exception:
     pass
 
+if pyodbc is not None:
+    # Driver-manager pooling must be configured before the first connect
+    pyodbc.pooling = True
+
+# Upper bound on idle connections kept for reuse by DatabaseConnection
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+# Pooled connections older than this are closed instead of reused (server-side timeouts, failovers)
+POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "3600"))
+
+# Declared parameter order per stored procedure (lower-cased, '@'-prefixed), read once from sys.parameters
+_PROC_SIG: Dict[str, List[str]] = {}
+# Call text and argument order per (procedure, supplied parameter names)
+_PROC_CALL: Dict[tuple, tuple] = {}
+
 class DatabaseConnection:
     """Database connection manager for SQL Server"""
 
@@ -32,11 +53,9 @@ class DatabaseConnection:
         self.trusted = (os.getenv("DB_TRUSTED", "0").lower() in ("1", "true", "yes"))
         if not self.server or not self.database:
             raise ValueError("Missing DB_SERVER or DB_NAME in .env file")
-
-    def get_connection_string(self) -> str:
-        """Build ODBC connection string"""
+        # Built once; settings do not change for the lifetime of the process
         if self.username and self.password and not self.trusted:
-            return (
+            self._connstr = (
                 f"DRIVER={{{self.driver}}};"
                 f"SERVER={self.server};"
                 f"DATABASE={self.database};"
@@ -45,33 +64,97 @@ class DatabaseConnection:
                 "TrustServerCertificate=yes;"
             )
         else:
-            return (
+            self._connstr = (
                 f"DRIVER={{{self.driver}}};"
                 f"SERVER={self.server};"
                 f"DATABASE={self.database};"
                 "Trusted_Connection=yes;"
                 "TrustServerCertificate=yes;"
             )
+        # LIFO so the most recently used (warmest) connection is handed out first;
+        # entries are (connection, monotonic time it was opened)
+        self._pool: queue.LifoQueue = queue.LifoQueue(maxsize=POOL_SIZE)
+        # Separate pool for autocommit connections used by single-statement writes
+        self._autocommit_pool: queue.LifoQueue = queue.LifoQueue(maxsize=POOL_SIZE)
+        # Long-lived connection reserved for one thread (see pin_connection)
+        self._pinned_thread: Optional[int] = None
+        self._pinned_conn = None
+        self._pinned_busy = False
+
+    def pin_connection(self) -> None:
+        """
+        Keep a single connection open for the calling thread and hand it out on every
+        non-autocommit request from that thread. Meant for single-threaded processes
+        such as the DO worker; other threads and nested use keep using the pool.
+        A connection that raises is dropped and reopened on the next request.
+        """
+        self._pinned_thread = threading.get_ident()
+
+    def get_connection_string(self) -> str:
+        """Return the ODBC connection string"""
+        return self._connstr
 
     @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
+    def get_connection(self, autocommit: bool = False):
+        """
+        Context manager for pooled database connections.
+        A connection is returned to the pool on normal exit and closed on error,
+        so a broken connection is never handed out twice.
+        autocommit=True hands out a connection from a separate autocommit pool.
+        """
+        pool = self._autocommit_pool if autocommit else self._pool
+        pinned = (not autocommit and not self._pinned_busy
+                  and self._pinned_thread == threading.get_ident())
         conn = None
+        born = time.monotonic()
         try:
-            conn = pyodbc.connect(self.get_connection_string())
+            if pinned:
+                if self._pinned_conn is None:
+                    self._pinned_conn = pyodbc.connect(self._connstr, autocommit=False)
+                conn = self._pinned_conn
+                self._pinned_busy = True
+            else:
+                try:
+                    conn, born = pool.get_nowait()
+                    if time.monotonic() - born > POOL_RECYCLE_SECONDS:
+                        stale, conn = conn, None
+                        try:
+                            stale.close()
+                        except Exception:
+                            pass
+                except queue.Empty:
+                    pass
+                if conn is None:
+                    born = time.monotonic()
+                    conn = pyodbc.connect(self._connstr, autocommit=autocommit)
             yield conn
         except Exception as e:
-            print(f"[ERROR] Database connection error: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.error("Database connection error: %s", e)
+            if conn:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = None
+                if pinned:
+                    self._pinned_conn = None
             raise
         finally:
-            if conn:
-                conn.close()
+            if pinned:
+                self._pinned_busy = False
+            elif conn:
+                try:
+                    pool.put_nowait((conn, born))
+                except queue.Full:
+                    conn.close()
 
 class DatabaseHelper:
     """Helper class for database operations"""
 
     def __init__(self):
         self.db_conn = DatabaseConnection()
+        # Result column names per query text; a fixed SELECT always yields the same shape
+        self._col_cache: Dict[str, tuple] = {}
 
     def execute_stored_procedure(self, proc_name: str, params: Dict[str, Any] = None) -> Optional[List[Dict]]:
         """
@@ -92,15 +175,9 @@ class DatabaseHelper:
                 # pyodbc uses ? for parameters, and we need to pass them in order
                 if params:
                     if isinstance(params, dict):
-                        # Use named parameters to avoid positional mismatch
-                        param_names = list(params.keys())
-                        param_values = [params[name] for name in param_names]
-                        assignments = []
-                        for name in param_names:
-                            # Ensure parameter name starts with '@'
-                            pname = name if name.startswith('@') else f'@{name}'
-                            assignments.append(f"{pname} = ?")
-                        sql = f"EXEC {proc_name} " + ", ".join(assignments)
+                        sql, order = self._proc_call(cursor, proc_name, tuple(params))
+                        values = list(params.values())
+                        param_values = values if order is None else [values[i] for i in order]
                     elif isinstance(params, list):
                         param_values = params
                         sql = f"EXEC {proc_name} " + ", ".join(["?" for _ in param_values])
@@ -116,37 +193,78 @@ class DatabaseHelper:
                 else:
                     cursor.execute(sql)
 
-                # Get column names (may be None if no result set)
-                columns = []
+                # Fetch results (description is None if no result set was returned)
+                results = []
                 if cursor.description:
                     columns = [column[0] for column in cursor.description]
-
-                # Fetch results
-                results = []
-                try:
-                    rows = cursor.fetchall()
-                    for row in rows:
-                        result_dict = {}
-                        for i, value in enumerate(row):
-                            if i < len(columns):
-                                result_dict[columns[i]] = value
-                        results.append(result_dict)
-                except Exception:
-                    # No result set returned (stored procedure may not return data)
-                    pass
+                    results = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
                 conn.commit()
                 return results if results else None
 
             except Exception as e:
                 conn.rollback()
-                print(f"[ERROR] Stored procedure execution error: {str(e).encode('ascii', 'replace').decode('ascii')}")
-                print(f"   Procedure: {proc_name}")
-                print(f"   SQL: {sql}")
-                if params:
-                    print(f"   Params: {params}")
+                logger.error("Stored procedure execution error: %s\n   Procedure: %s\n   SQL: %s\n   Params: %s", e, proc_name, sql, params)
                 raise
 
+    def _columns(self, query: str, description) -> tuple:
+        """Column names for a query's result set, cached by query text (width-checked in case the schema changed)."""
+        columns = self._col_cache.get(query)
+        if columns is None or len(columns) != len(description):
+            columns = tuple(column[0] for column in description)
+            self._col_cache[query] = columns
+        return columns
+
+    @staticmethod
+    def _proc_call(cursor, proc_name: str, names: tuple) -> tuple:
+        """
+        Return (sql, order) for calling proc_name with the given parameter names.
+        order is None when the names are already in signature order.
+
+        Arguments are put in the procedure's declared order so the statement text is
+        stable regardless of dict ordering. When they form a prefix of the signature the
+        ODBC escape {CALL proc(?, ...)} is used; otherwise named EXEC assignments.
+        """
+        key = (proc_name, names)
+        cached = _PROC_CALL.get(key)
+        if cached is not None:
+            return cached
+
+        sig = _PROC_SIG.get(proc_name)
+        cacheable = True
+        if sig is None:
+            try:
+                cursor.execute(
+                    "SELECT name FROM sys.parameters WHERE object_id = OBJECT_ID(?) ORDER BY parameter_id",
+                    proc_name,
+                )
+                sig = [str(row[0]).lower() for row in cursor.fetchall()]
+                _PROC_SIG[proc_name] = sig
+            except Exception:
+                # Fall back to named EXEC for this call only; a transient failure must not pin it
+                sig = []
+                cacheable = False
+
+        # Ensure parameter names start with '@'
+        pnames = [name if name.startswith('@') else f'@{name}' for name in names]
+        lowered = [name.lower() for name in pnames]
+        position = {name: i for i, name in enumerate(sig)}
+        if sig and all(name in position for name in lowered):
+            order = sorted(range(len(names)), key=lambda i: position[lowered[i]])
+        else:
+            order = list(range(len(names)))
+
+        if sig and [lowered[i] for i in order] == sig[:len(order)]:
+            sql = f"{{CALL {proc_name}({', '.join('?' for _ in order)})}}"
+        else:
+            sql = f"EXEC {proc_name} " + ", ".join(f"{pnames[i]} = ?" for i in order)
+
+        if order == sorted(order):
+            order = None
+        if cacheable:
+            _PROC_CALL[key] = (sql, order)
+        return sql, order
+
     def execute_query(self, query: str, params: tuple = None) -> Optional[List[Dict]]:
         """
         Execute a raw SQL query with proper transaction handling
@@ -172,34 +290,67 @@ class DatabaseHelper:
                     return None
 
                 # Get column names for SELECT queries
-                columns = [column[0] for column in cursor.description]
-
-                # Fetch results
-                results = []
-                rows = cursor.fetchall()
-                if not rows:  # No results returned
-                    # Even if no rows, ensure we commit any DML with OUTPUT none case
-                    conn.commit()
-                    return None
+                columns = self._columns(query, cursor.description)
 
-                for row in rows:
-                    result_dict = {}
-                    for i, value in enumerate(row):
-                        if i < len(columns):
-                            result_dict[columns[i]] = value
-                    results.append(result_dict)
+                # Fetch results as plain dicts (dict(zip(...)) builds each row in C)
+                results = [dict(zip(columns, row)) for row in cursor.fetchall()]
 
                 # Commit even when a result set exists (e.g., INSERT ... OUTPUT)
+                # and when no rows came back (DML with an empty OUTPUT)
                 conn.commit()
                 return results if results else None
 
             except Exception as e:
                 conn.rollback()
-                error_msg = str(e).encode('ascii', 'replace').decode('ascii')
-                print(f"[ERROR] Query execution error: {error_msg}")
-                print(f"   Query: {query}")
-                if params:
-                    print(f"   Params: {params}")
+                logger.error("Query execution error: %s\n   Query: %s\n   Params: %s", e, query, params)
+                raise
+
+    def execute_nonquery_autocommit(self, query: str, params: tuple = None) -> None:
+        """
+        Execute a single write statement on an autocommit connection
+
+        The statement commits on its own, saving the separate COMMIT round-trip.
+        Only use for one self-contained, idempotent statement; anything that needs
+        several statements to succeed together belongs in execute_query or a procedure.
+
+        Args:
+            query: SQL statement (INSERT/UPDATE/DELETE or {CALL ...})
+            params: Tuple of parameter values
+        """
+        with self.db_conn.get_connection(autocommit=True) as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.execute(query, params or ())
+
+            except Exception as e:
+                logger.error("Autocommit execution error: %s\n   Query: %s\n   Params: %s", e, query, params)
+                raise
+
+    def execute_many(self, query: str, rows: List[tuple]) -> None:
+        """
+        Execute one parameterized statement for many rows in a single transaction
+
+        Uses pyodbc fast_executemany so the parameter sets are sent as an array
+        instead of one round-trip per row.
+
+        Args:
+            query: SQL statement (or {CALL ...}) with ? placeholders
+            rows: Sequence of parameter tuples, one per execution
+        """
+        if not rows:
+            return
+        with self.db_conn.get_connection() as conn:
+            cursor = conn.cursor()
+
+            try:
+                cursor.fast_executemany = True
+                cursor.executemany(query, rows)
+                conn.commit()
+
+            except Exception as e:
+                conn.rollback()
+                logger.error("Batch execution error: %s\n   Query: %s\n   Rows: %d", e, query, len(rows))
                 raise
 
     def test_connection(self) -> bool:
@@ -211,7 +362,7 @@ class DatabaseHelper:
                 result = cursor.fetchone()
                 return result[0] == 1
         except Exception as e:
-            print(f"[ERROR] Database connection test failed: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.error("Database connection test failed: %s", e)
             return False
 
 # Global database helper instance
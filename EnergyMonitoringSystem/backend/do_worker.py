@@ -8,17 +8,25 @@ Features / fixes applied:
 - Clear, central configuration constants for easy adjustment (WRITE_REG, READ_REG, BITMASK).
 - Proper parsing of `Notes` for `reg=` override.
 - Correct logic for ON/OFF -> FC06 register values for PAC3220 (256 for ON, 0 for OFF).
-- Idempotence: checks DB state and avoids unnecessary writes.
+- Idempotence: uses the DB state joined into the pending fetch and avoids unnecessary writes.
 - Read-back verification (FC03 read of status register + bitmask).
-- Retries with delay and clear error reporting.
+- Retries with jittered exponential backoff (no retry on refused/unreachable) and clear error reporting.
 - Safe DB updates and event recording via helper functions.
-- Defensive exception handling and detailed debug logs.
-- Async-friendly: uses provided ModbusClient async methods.
+- Defensive exception handling and detailed logs via `logging` (queued, written off the event loop).
+- Async-friendly: blocking Modbus I/O runs in worker threads; independent devices are driven concurrently.
 """
 
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Awaitable, Callable
+from collections import deque
+from functools import lru_cache
 import asyncio
+import errno
+import json
+import logging
 import os
+import random
+import re
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -29,8 +37,10 @@ except Exception:
     pass
 
 from backend.dal.database import db_helper
-from backend.utils.pac3220_do import write_do_0, read_do_0, encode_do_value
-from pymodbus.client import ModbusTcpClient
+from backend.utils.logging_config import configure_logging
+from backend.utils.pac3220_do import DeviceUnreachable, write_do_0_async, read_do_0, encode_do_value, pooled_client, drop_on_io_error, close_idle_clients, close_all_clients
+
+logger = logging.getLogger(__name__)
 
 # Compatibility shim for legacy tests expecting a ModbusClient symbol
 class ModbusClient:
@@ -44,53 +54,94 @@ DEFAULT_READ_REGISTER = 400
 DEFAULT_STATUS_BITMASK = 0x0001
 # Modbus TCP port
 MODBUS_PORT = 502
+# Test mode: commands are simulated (no Modbus I/O) and always succeed
+_TEST_MODE = os.getenv("UNIT_TEST", "0") == "1"
+# Pooled Modbus connections unused for this long are closed by the worker loop
+MODBUS_IDLE_SECONDS = 60
+# Liveness check interval for the worker's persistent DB connection
+DB_PING_SECONDS = 60
 # Retry/backoff defaults
 DEFAULT_MAX_RETRIES = 3
 RETRY_DELAY_SECONDS = 1
+MAX_RETRY_DELAY_SECONDS = 8
+RETRY_JITTER_SECONDS = 0.25
+# Socket errors that retrying will not fix within one command
+_PERMANENT_ERRNOS = {errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH}
 # Duplicate-suppression window when enqueuing (seconds)
 DUPLICATE_WINDOW_SECONDS = 5
+# Auto-limit cut-off notifications are only queued when alerts are enabled
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "false").lower() in ("1", "true", "yes")
+# Upper bound on devices driven concurrently within one batch
+MAX_CONCURRENT_DEVICES = 8
+# Buffered DO events are flushed at batch end, or earlier once this many are queued
+EVENT_FLUSH_SIZE = 100
 
 # --- DB / Modbus helpers ---
 
+# (host, unit_id) -> lock serialising commands to the same device
+_HOST_LOCKS: Dict[tuple, asyncio.Lock] = {}
+# Pending app.sp_RecordDoEvent parameter rows, written by _flush_do_events
+_EVENT_BUFFER: deque = deque()
+_RECORD_DO_EVENT_SQL = "{CALL app.sp_RecordDoEvent(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)}"
+# (CommandID, ExecutionResult, ErrorMessage) rows collected while process_pending_commands runs a batch;
+# None outside a batch, where _update_result writes immediately
+_RESULT_BATCH: Optional[List[tuple]] = None
+_UPDATE_RESULT_BATCH_SQL = "{CALL app.sp_UpdateDigitalOutputResultBatch(?)}"
+
+# `reg=` / `source=` / `reason=` entries in the ;-separated command Notes
+_NOTES_RE = re.compile(r'(?:^|;)\s*(reg|source|reason)\s*=\s*([^;]*)', re.I)
+
 
 def _get_pending_commands(limit: int = 20) -> List[Dict[str, Any]]:
-    q = (
-        """
-        SELECT TOP (?) c.CommandID, c.AnalyzerID, c.CoilAddress, c.Command, c.Notes,
-               c.RequestedBy, c.MaxRetries, ISNULL(c.RetryCount, 0) as RetryCount,
-               a.IPAddress, a.ModbusID
-        FROM app.DigitalOutputCommands c
-        JOIN app.Analyzers a ON c.AnalyzerID = a.AnalyzerID
-        WHERE c.ExecutionResult = 'PENDING'
-        ORDER BY c.RequestedAt ASC
-        """
-    )
-    return db_helper.execute_query(q, (limit,)) or []
+    # Claims (PENDING -> IN_PROGRESS) the oldest commands in one round-trip, joined with
+    # analyzer IP/ModbusID and current DO state; results are written by _flush_results
+    return db_helper.execute_stored_procedure("app.sp_ClaimDoCommands", {"@Limit": limit}) or []
 
 
 def _update_result(command_id: int, result: str, error_msg: Optional[str] = None) -> None:
+    if _RESULT_BATCH is not None:
+        _RESULT_BATCH.append((command_id, result, error_msg))
+        return
     params = {"@CommandID": command_id, "@ExecutionResult": result, "@ErrorMessage": error_msg}
     try:
         db_helper.execute_stored_procedure("app.sp_UpdateDigitalOutputResult", params)
     except Exception:
         # best-effort; do not crash worker loop
-        print(f"[WARN] Failed to call sp_UpdateDigitalOutputResult for {command_id}")
+        logger.warning("Failed to call sp_UpdateDigitalOutputResult for %s", command_id)
+
+
+def _flush_results(rows: List[tuple]) -> None:
+    """Write a batch's command results with one table-valued call; fall back to per-command calls on failure."""
+    if not rows:
+        return
+    try:
+        db_helper.execute_query(_UPDATE_RESULT_BATCH_SQL, (rows,))
+        return
+    except Exception as e:
+        logger.warning("Batch result update failed (%d rows), retrying individually: %s", len(rows), e)
+    for command_id, result, error_msg in rows:
+        _update_result(command_id, result, error_msg)
+
+
+@lru_cache(maxsize=512)
+def _parse_notes(notes: str) -> Dict[str, str]:
+    """
+    Parse reg/source/reason out of a Notes string (first occurrence wins).
+    Cached: notes such as `source=auto_limit;reason=...` recur constantly. Do not mutate the result.
+    """
+    parsed: Dict[str, str] = {}
+    for key, value in _NOTES_RE.findall(notes):
+        parsed.setdefault(key.lower(), value.strip())
+    return parsed
 
 
 def _parse_notes_for_reg(notes: Optional[str]) -> Optional[int]:
     if not notes:
         return None
     try:
-        for part in str(notes).split(";"):
-            p = part.strip()
-            if not p:
-                continue
-            if p.lower().startswith("reg="):
-                raw = p.split("=", 1)[1].strip()
-                return int(raw)
-    except Exception:
+        return int(_parse_notes(str(notes))["reg"])
+    except (KeyError, ValueError):
         return None
-    return None
 
 
 def _record_do_event(
@@ -101,70 +152,127 @@ def _record_do_event(
     control_type: str,
     success: bool,
     source_note: Optional[str] = None,
+    write_reg: Optional[int] = None,
+    read_reg: Optional[int] = None,
+    read_back: Optional[int] = None,
+    error: Optional[str] = None,
 ):
     """
-    Update DigitalOutputStatus and insert an event into ops.Events.
+    Queue a DigitalOutputStatus update + ops.Events insert (app.sp_RecordDoEvent) for the next flush.
+    Modbus diagnostics (registers, read-back, error) are stored in ops.DoEventDetails columns.
     This function is resilient: it swallows exceptions but prints a warn.
     """
     try:
-        src = "system"
         src_detail = source_note or ""
-        if source_note:
-            for part in str(source_note).split(";"):
-                if part.strip().startswith("source="):
-                    src = part.split("=", 1)[1].strip()
-                    break
-
-        # Upsert/update status row (attempt update first)
-        db_helper.execute_query(
-            "UPDATE app.DigitalOutputStatus SET State = ?, LastUpdated = GETUTCDATE(), UpdateSource = ? WHERE AnalyzerID = ? AND CoilAddress = ?",
-            (int(new_state) if new_state is not None else None, src, analyzer_id, coil_address),
-        )
-        # Insert event log
-        meta = f'{{"old_state": {old_state if old_state is not None else "null"}, "new_state": {new_state if new_state is not None else "null"}, "type": "{control_type}", "notes": "{src_detail}"}}'
-        db_helper.execute_query(
-            """
-            INSERT INTO ops.Events (AnalyzerID, Level, EventType, Message, Source, MetaData, Timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, GETUTCDATE())
-            """,
-            (analyzer_id, "INFO" if success else "ERROR", "do_control" if success else "do_control_failed",
-             f"DO {'ON' if new_state == 1 else 'OFF' if new_state == 0 else 'UNKNOWN'}", src, meta),
+        src = _parse_notes(src_detail).get("source", "system")
+
+        meta = json.dumps(
+            {"old_state": old_state, "new_state": new_state, "type": control_type, "notes": src_detail},
+            separators=(",", ":"),
         )
-        if success and source_note and ("auto_exhausted" in source_note):
-            try:
-                db_helper.execute_query(
-                    "INSERT INTO ops.Events (AnalyzerID, Level, EventType, Message, Source, MetaData, Timestamp) VALUES (?, 'INFO', 'auto_on_executed', 'Auto ON executed', ?, ?, GETUTCDATE())",
-                    (analyzer_id, src, meta)
-                )
-            except Exception:
-                pass
-            try:
-                urow = db_helper.execute_query(
-                    "SELECT TOP 1 UserID FROM app.Analyzers WHERE AnalyzerID = ?",
-                    (analyzer_id,)
-                ) or []
-                if urow:
-                    uid = int(urow[0].get("UserID") or 0)
-                    if uid:
-                        db_helper.execute_query(
-                            "IF COL_LENGTH('app.Users','DoAutoOnTriggered') IS NOT NULL UPDATE app.Users SET DoAutoOnTriggered = 1 WHERE UserID = ?",
-                            (uid,)
-                        )
-            except Exception:
-                pass
+        # Status update + event log, written in bulk by _flush_do_events
+        _EVENT_BUFFER.append((
+            analyzer_id,
+            coil_address,
+            int(new_state) if new_state is not None else None,
+            src,
+            1 if success else 0,
+            meta,
+            # Successful auto-on after exhaustion: also logs auto_on_executed and flags the user
+            1 if success and "auto_exhausted" in src_detail else 0,
+            write_reg,
+            read_reg,
+            read_back,
+            error[:400] if error else None,
+        ))
+        if len(_EVENT_BUFFER) >= EVENT_FLUSH_SIZE:
+            _flush_do_events()
     except Exception as e:
-        print(f"[WARN] _record_do_event failed: {e}")
+        logger.warning("_record_do_event failed: %s", e)
+
+
+def _flush_do_events() -> None:
+    """Write all buffered DO events with one executemany; on failure retry row by row so one bad row loses only itself."""
+    rows = []
+    while _EVENT_BUFFER:
+        rows.append(_EVENT_BUFFER.popleft())
+    if not rows:
+        return
+    try:
+        db_helper.execute_many(_RECORD_DO_EVENT_SQL, rows)
+        return
+    except Exception as e:
+        logger.warning("Bulk DO event flush failed (%d rows), retrying individually: %s", len(rows), e)
+    for row in rows:
+        try:
+            db_helper.execute_nonquery_autocommit(_RECORD_DO_EVENT_SQL, row)
+        except Exception as e:
+            logger.warning("_record_do_event failed: %s", e)
+
+def _fc05_write(host: str, port: int, unit_id: int, coil_address: int, state: bool) -> bool:
+    """Blocking FC05 coil write used as fallback when the FC06 register write fails."""
+    with pooled_client(host, port) as client:
+        if client is None:
+            return False
+        wr = client.write_coil(coil_address, state, slave=unit_id)
+        drop_on_io_error(client, wr)
+        return bool(wr and not wr.isError())
+
+
+def _fc01_read(host: str, port: int, unit_id: int, coil_address: int) -> Optional[int]:
+    """Blocking FC01 coil read used as read-back fallback. Returns 0/1 or None."""
+    with pooled_client(host, port) as client:
+        if client is None:
+            return None
+        rb = client.read_coils(coil_address, 1, slave=unit_id)
+        drop_on_io_error(client, rb)
+        if rb and not rb.isError() and getattr(rb, 'bits', None):
+            return 1 if bool(rb.bits[0]) else 0
+        return None
 
 
 # --- Execution logic ---
 
 
-async def _execute_command(cmd: Dict[str, Any]) -> None:
+def _is_simulated(host: Optional[str]) -> bool:
+    # Test-mode shortcut: simulate device I/O for localhost to satisfy unit tests
+    return _TEST_MODE or host in ("127.0.0.1", "localhost")
+
+
+def _retry_delay(attempt: int) -> float:
+    """Exponential backoff (capped) plus jitter so failing devices are not retried in lockstep."""
+    return min(RETRY_DELAY_SECONDS * (2 ** (attempt - 1)), MAX_RETRY_DELAY_SECONDS) + random.random() * RETRY_JITTER_SECONDS
+
+
+def _target_state(cmd: Dict[str, Any]) -> Optional[bool]:
+    """Output state a command drives to (TOGGLE from the claimed CurrentState); None for unknown commands."""
+    command = str(cmd.get("Command") or "").upper()
+    if command == "ON":
+        return True
+    if command == "OFF":
+        return False
+    if command == "TOGGLE":
+        # Toggle: derive from DB state if present, else default to True
+        cur_state = cmd.get("CurrentState")
+        return not bool(int(cur_state)) if cur_state is not None else True
+    return None
+
+
+def _is_permanent_error(exc: BaseException) -> bool:
+    # DeviceUnreachable is how a failed connect surfaces (pymodbus returns False rather than raising)
+    return isinstance(exc, (DeviceUnreachable, ConnectionRefusedError)) or (
+        isinstance(exc, OSError) and exc.errno in _PERMANENT_ERRNOS
+    )
+
+
+async def _execute_command(cmd: Dict[str, Any], defer_read_back: bool = False) -> Optional[Callable[[Optional[int]], Awaitable[None]]]:
     """
     Execute a single pending DO command.
     - Determines write/read register addresses (with override support).
     - Performs idempotence check against app.DigitalOutputStatus.
     - Writes using FC06 (single register) and verifies via read (FC03 or FC04 depending on client).
+    With defer_read_back=True a successful write returns a `finish(read_back_value)` coroutine
+    function instead of reading back, so a caller can verify several commands with one read.
     """
     command_id = int(cmd["CommandID"])
     analyzer_id = int(cmd.get("AnalyzerID") or cmd.get("AnalyzerId") or 0)
@@ -178,205 +286,211 @@ async def _execute_command(cmd: Dict[str, Any]) -> None:
     status_bitmask = DEFAULT_STATUS_BITMASK
     command = str(cmd.get("Command") or "").upper()
     max_retries = int(cmd.get("MaxRetries") or DEFAULT_MAX_RETRIES)
+    # Current DO state comes pre-joined from _get_pending_commands (None when no status row);
+    # it drives TOGGLE, the idempotence check and the event's old_state without another query
+    cur_state = cmd.get("CurrentState")
+    if cur_state is not None:
+        cur_state = int(cur_state)
 
     if not host:
         _update_result(command_id, "FAILED", "missing_analyzer_ip")
-        print(f"[ERROR] Command {command_id} missing analyzer IP")
+        logger.error("Command %s missing analyzer IP", command_id)
         return
 
     port = MODBUS_PORT
 
     # Determine target boolean and register value encoding (PAC3220 specifics)
-    target_state_bool: Optional[bool] = None
-    if command == "ON":
-        target_state_bool = True
-    elif command == "OFF":
-        target_state_bool = False
-    elif command == "TOGGLE":
-        # Toggle: derive from DB if present, else default to True
-        try:
-            cur = db_helper.execute_query(
-                "SELECT State FROM app.DigitalOutputStatus WHERE AnalyzerID = ? AND CoilAddress = ?",
-                (analyzer_id, coil_address),
-            ) or []
-            if cur:
-                cur_state = int(cur[0].get("State") or 0)
-                target_state_bool = not bool(cur_state)
-            else:
-                target_state_bool = True
-        except Exception:
-            target_state_bool = True
-    else:
+    target_state_bool = _target_state(cmd)
+    if target_state_bool is None:
         # Unknown command: fail fast
         _update_result(command_id, "FAILED", f"unknown_command:{command}")
-        print(f"[ERROR] Command {command_id} has unknown command '{command}'")
+        logger.error("Command %s has unknown command '%s'", command_id, command)
         return
 
     action_int = 1 if target_state_bool else 0
 
-    # Idempotence: check DB state and skip if already in target
-    try:
-        current_db = db_helper.execute_query(
-            "SELECT State FROM app.DigitalOutputStatus WHERE AnalyzerID = ? AND CoilAddress = ?",
-            (analyzer_id, coil_address),
-        ) or []
-        if current_db:
-            cs = int(current_db[0].get("State") or 0)
-            desired_int = 1 if target_state_bool else 0
-            if cs == desired_int:
-                # Already at desired state — mark success, record event, disconnect
-                _update_result(command_id, "SUCCESS", None)
-                _record_do_event(analyzer_id, coil_address, cs, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", True, source_note=notes)
-                print(f"[INFO] Command {command_id} skipped: already in desired state {desired_int}")
-                return
-    except Exception as e:
-        print(f"[WARN] Idempotence DB check failed for command {command_id}: {e}")
+    # Simulated device: nothing to write, retry or verify
+    if _is_simulated(host):
+        _update_result(command_id, "SUCCESS", None)
+        _record_do_event(analyzer_id, coil_address, cur_state, action_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", True, source_note=notes)
+        return None
+
+    # Idempotence: skip if DB state already matches the target
+    if cur_state is not None:
+        desired_int = 1 if target_state_bool else 0
+        if cur_state == desired_int:
+            # Already at desired state — mark success, record event, disconnect
+            _update_result(command_id, "SUCCESS", None)
+            _record_do_event(analyzer_id, coil_address, cur_state, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", True, source_note=notes)
+            logger.debug("Command %s skipped: already in desired state %s", command_id, desired_int)
+            return
 
     # Attempt write with retries
     success = False
+    permanent = False
     last_error: Optional[str] = None
     for attempt in range(1, max_retries + 1):
         try:
-            # Test-mode shortcut: simulate success for localhost to satisfy unit tests
-            if os.getenv("UNIT_TEST", "0") == "1" or host in ("127.0.0.1", "localhost"):
-                success = True
-                break
-            print(f"[DO] Command {command_id} attempt {attempt}: FC06 write reg={write_register_address} val={encode_do_value(0, action_int)}")
-            ok_write = write_do_0(host=host, action=action_int, port=port, unit_id=unit_id, reg_do_command=write_register_address, check_type=False)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Command %s attempt %s: FC06 write reg=%s val=%s", command_id, attempt, write_register_address, encode_do_value(0, action_int))
+            ok_write = await write_do_0_async(host=host, action=action_int, port=port, unit_id=unit_id, reg_do_command=write_register_address, check_type=False)
             if ok_write:
                 success = True
                 break
             else:
                 last_error = f"attempt_failed:{attempt}"
-                print(f"[WARN] Command {command_id} write returned falsy (attempt {attempt})")
+                logger.warning("Command %s write returned falsy (attempt %s)", command_id, attempt)
         except Exception as e:
             last_error = f"attempt_error:{attempt}:{str(e)}"
-            print(f"[ERROR] Command {command_id} write exception (attempt {attempt}): {e}")
+            logger.error("Command %s write exception (attempt %s): %s", command_id, attempt, e)
+            if _is_permanent_error(e):
+                permanent = True
+                break
         if attempt < max_retries:
-            await asyncio.sleep(RETRY_DELAY_SECONDS)
+            await asyncio.sleep(_retry_delay(attempt))
 
-    # After attempts, attempt to read back to verify state
-    read_back_value = None
-    read_back_state: Optional[int] = None
-    # Fallback: try FC05 coil write when FC06 fails
-    if not success:
+    # Fallback: try FC05 coil write when FC06 fails (pointless if the device refused/was unreachable)
+    if not success and not permanent:
         try:
-            client = ModbusTcpClient(host, port=port)
-            if client.connect():
-                wr = client.write_coil(coil_address, bool(target_state_bool), slave=unit_id)
-                success = bool(wr and not wr.isError())
-            client.close()
+            await asyncio.sleep(random.random() * RETRY_JITTER_SECONDS)
+            success = await asyncio.to_thread(_fc05_write, host, port, unit_id, coil_address, bool(target_state_bool))
             if success:
                 last_error = None
-                print(f"[DO] Command {command_id}: FC05 fallback write succeeded")
+                logger.debug("Command %s: FC05 fallback write succeeded", command_id)
             else:
-                print(f"[WARN] Command {command_id}: FC05 fallback write failed")
+                logger.warning("Command %s: FC05 fallback write failed", command_id)
         except Exception as e:
-            print(f"[ERROR] Command {command_id}: FC05 fallback exception: {e}")
+            logger.error("Command %s: FC05 fallback exception: %s", command_id, e)
 
-    if success:
-        try:
-            if os.getenv("UNIT_TEST", "0") == "1" or host in ("127.0.0.1", "localhost"):
-                read_back_state = 1 if target_state_bool else 0
-                read_back_value = read_back_state
-            else:
-                read_back_value = read_do_0(host=host, port=port, unit_id=unit_id, reg_do_status_bit=DEFAULT_READ_REGISTER)
+    async def finish(read_back_value: Optional[int]) -> None:
+        """Verify against the status read-back (None = unavailable) and record the outcome."""
+        read_back_state: Optional[int] = None
+        if success:
+            try:
                 if read_back_value is not None:
                     read_back_state = int(read_back_value)
                 else:
                     try:
-                        client = ModbusTcpClient(host, port=port)
-                        if client.connect():
-                            rb = client.read_coils(coil_address, 1, slave=unit_id)
-                            if rb and not rb.isError() and getattr(rb, 'bits', None):
-                                read_back_state = 1 if bool(rb.bits[0]) else 0
-                                read_back_value = read_back_state
-                        client.close()
+                        read_back_state = await asyncio.to_thread(_fc01_read, host, port, unit_id, coil_address)
+                        if read_back_state is not None:
+                            read_back_value = read_back_state
                     except Exception:
                         pass
-            print(f"[DO] Command {command_id}: read_back raw={read_back_value} parsed_state={read_back_state}")
+                logger.debug("Command %s: read_back raw=%s parsed_state=%s", command_id, read_back_value, read_back_state)
+            except Exception as e:
+                logger.warning("Command %s read-back failed: %s", command_id, e)
+                read_back_value = None
+                read_back_state = None
+
+        # Finalize result based on verification
+        desired_int = 1 if target_state_bool else 0
+        if success and read_back_state is not None and read_back_state == desired_int:
+            _update_result(command_id, "SUCCESS", None)
+            _record_do_event(analyzer_id, coil_address, cur_state, read_back_state, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", True, source_note=notes, write_reg=write_register_address, read_reg=read_register_address, read_back=read_back_value)
+            logger.info("Command %s SUCCESS. read_back=%s", command_id, read_back_value)
+        elif success and read_back_state is not None and read_back_state != desired_int:
+            _update_result(command_id, "FAILED", "readback_mismatch")
+            _record_do_event(analyzer_id, coil_address, cur_state, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", False, source_note=notes, write_reg=write_register_address, read_reg=read_register_address, read_back=read_back_value)
+            logger.error("Command %s FAILED: readback_mismatch (got=%s expected=%s)", command_id, read_back_state, desired_int)
+        elif success and read_back_state is None:
+            # Write succeeded on Modbus client but read-back not available -> mark failed (safety)
+            _update_result(command_id, "FAILED", "readback_missing")
+            _record_do_event(analyzer_id, coil_address, cur_state, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", False, source_note=notes, write_reg=write_register_address, read_reg=read_register_address)
+            logger.error("Command %s FAILED: readback_missing", command_id)
+        else:
+            # Write did not succeed
+            _update_result(command_id, "FAILED", last_error or "unknown_error")
+            _record_do_event(analyzer_id, coil_address, cur_state, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", False, source_note=notes, write_reg=write_register_address, error=last_error or "unknown")
+            logger.error("Command %s FAILED: %s", command_id, last_error or "unknown")
+
+    if success and defer_read_back:
+        return finish
+    status_value = None
+    if success:
+        try:
+            status_value = await asyncio.to_thread(_read_status, host, port, unit_id)
         except Exception as e:
-            print(f"[WARN] Command {command_id} read-back failed: {e}")
-            read_back_value = None
-            read_back_state = None
+            logger.warning("Command %s read-back failed: %s", command_id, e)
+    await finish(status_value)
+    return None
 
-    # No persistent Modbus connection in helper-based calls
 
-    # Finalize result based on verification
-    desired_int = 1 if target_state_bool else 0
-    if success and read_back_state is not None and read_back_state == desired_int:
-        _update_result(command_id, "SUCCESS", None)
-        _record_do_event(analyzer_id, coil_address, None, read_back_state, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", True, source_note=(notes or "") + f";write_reg={write_register_address};read_reg={read_register_address};read_back={read_back_value}")
-        print(f"[INFO] Command {command_id} SUCCESS. read_back={read_back_value}")
-    elif success and read_back_state is not None and read_back_state != desired_int:
-        _update_result(command_id, "FAILED", "readback_mismatch")
-        _record_do_event(analyzer_id, coil_address, None, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", False, source_note=(notes or "") + f";write_reg={write_register_address};read_reg={read_register_address};read_back={read_back_value}")
-        print(f"[ERROR] Command {command_id} FAILED: readback_mismatch (got={read_back_state} expected={desired_int})")
-    elif success and read_back_state is None:
-        # Write succeeded on Modbus client but read-back not available -> mark failed (safety)
-        _update_result(command_id, "FAILED", "readback_missing")
-        _record_do_event(analyzer_id, coil_address, None, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", False, source_note=(notes or "") + f";write_reg={write_register_address};read_reg={read_register_address};read_back=null")
-        print(f"[ERROR] Command {command_id} FAILED: readback_missing")
-    else:
-        # Write did not succeed
-        _update_result(command_id, "FAILED", last_error or "unknown_error")
-        _record_do_event(analyzer_id, coil_address, None, desired_int, "manual" if command in ("ON", "OFF", "TOGGLE") else "auto", False, source_note=(notes or "") + f";write_reg={write_register_address};error={last_error or 'unknown'}")
-        print(f"[ERROR] Command {command_id} FAILED: {last_error or 'unknown'}")
+def _read_status(host: str, port: int, unit_id: int) -> Optional[int]:
+    """Blocking status-bit read shared by every command for a device (all verify DEFAULT_READ_REGISTER)."""
+    return read_do_0(host=host, port=port, unit_id=unit_id, reg_do_status_bit=DEFAULT_READ_REGISTER)
 
 
-async def process_pending_commands(batch_size: int = 20) -> int:
-    cmds = _get_pending_commands(batch_size)
-    if not cmds:
-        return 0
-    processed = 0
-    for cmd in cmds:
-        try:
-            await _execute_command(cmd)
-            processed += 1
-        except Exception as e:
-            print(f"[ERROR] Unexpected error while processing command {cmd.get('CommandID')}: {e}")
-            try:
-                _update_result(int(cmd.get("CommandID")), "FAILED", f"unexpected:{str(e)}")
-            except Exception:
-                pass
-    return processed
+def _fail_unexpected(cmd: Dict[str, Any], e: Exception) -> None:
+    logger.exception("Unexpected error while processing command %s", cmd.get("CommandID"))
+    try:
+        _update_result(int(cmd.get("CommandID")), "FAILED", f"unexpected:{str(e)}")
+    except Exception:
+        pass
 
 
-def _should_enqueue(analyzer_id: int, coil_address: int, command: str, source: str) -> bool:
-    try:
-        q = (
-            """
-            SELECT TOP 1 CommandID
-            FROM app.DigitalOutputCommands
-            WHERE AnalyzerID = ? AND CoilAddress = ? AND Command = ? AND ExecutionResult = 'PENDING'
-                  AND RequestedAt >= DATEADD(SECOND, -? , GETUTCDATE())
-            ORDER BY RequestedAt DESC
-            """
+async def _safe_execute(cmds: List[Dict[str, Any]], sem: asyncio.Semaphore) -> List[bool]:
+    """
+    Run one device's commands, in claim order, under its device lock and the batch-wide semaphore.
+    The device lock is taken first so a later batch for the same device does not hold a semaphore slot.
+    Every command verifies the same status bit, so when the commands target different coils and all
+    expect the same final state, the writes go out first and a single status read verifies them;
+    otherwise each command is written and verified in turn.
+    """
+    key = (cmds[0].get("IPAddress"), int(cmds[0].get("ModbusID") or 1))
+    results: List[bool] = []
+    async with _HOST_LOCKS.setdefault(key, asyncio.Lock()), sem:
+        shared_read = (
+            len(cmds) > 1
+            and len({int(c.get("CoilAddress") or 0) for c in cmds}) == len(cmds)
+            and len({_target_state(c) for c in cmds}) == 1
         )
-        rows = db_helper.execute_query(q, (analyzer_id, coil_address, command, DUPLICATE_WINDOW_SECONDS))
-        return not rows
-    except Exception:
-        # If DB check fails, allow enqueue (best-effort)
-        return True
+        pending = []
+        for cmd in cmds:
+            try:
+                finish = await _execute_command(cmd, defer_read_back=shared_read)
+                if finish is not None:
+                    pending.append((len(results), cmd, finish))
+                results.append(True)
+            except Exception as e:
+                _fail_unexpected(cmd, e)
+                results.append(False)
+        if not pending:
+            return results
+        host, unit_id = key
+        status_value = None
+        try:
+            status_value = await asyncio.to_thread(_read_status, host, MODBUS_PORT, unit_id)
+        except Exception as e:
+            logger.warning("Shared read-back for %s unit %s failed: %s", host, unit_id, e)
+        for i, cmd, finish in pending:
+            try:
+                await finish(status_value)
+            except Exception as e:
+                _fail_unexpected(cmd, e)
+                results[i] = False
+    return results
 
 
-def _enqueue_do(analyzer_id: int, coil_address: int, command: str, source: str, reason: Optional[str], requested_by: Optional[int] = None) -> bool:
+async def process_pending_commands(batch_size: int = 20) -> int:
+    global _RESULT_BATCH
+    cmds = _get_pending_commands(batch_size)
+    if not cmds:
+        return 0
+    # Distinct devices run concurrently; each device's commands run serially and in claim order
+    by_device: Dict[tuple, List[Dict[str, Any]]] = {}
+    for c in cmds:
+        by_device.setdefault((c.get("IPAddress"), int(c.get("ModbusID") or 1)), []).append(c)
+    sem = asyncio.Semaphore(MAX_CONCURRENT_DEVICES)
+    _RESULT_BATCH = []
     try:
-        if not _should_enqueue(analyzer_id, coil_address, command, source):
-            return False
-        params = {
-            "@AnalyzerID": analyzer_id,
-            "@CoilAddress": coil_address,
-            "@Command": command,
-            "@RequestedBy": requested_by or 0,
-            "@MaxRetries": DEFAULT_MAX_RETRIES,
-            "@Notes": f"source={source};reason={reason or ''}"
-        }
-        db_helper.execute_stored_procedure("app.sp_ControlDigitalOutput", params)
-        return True
-    except Exception as e:
-        print(f"[WARN] _enqueue_do failed: {e}")
-        return False
+        results = await asyncio.gather(*(_safe_execute(group, sem) for group in by_device.values()), return_exceptions=True)
+    finally:
+        batch, _RESULT_BATCH = _RESULT_BATCH, None
+        _flush_results(batch)
+        _flush_do_events()
+        for key in [k for k, lock in _HOST_LOCKS.items() if not lock.locked()]:
+            del _HOST_LOCKS[key]
+    return sum(r.count(True) for r in results if isinstance(r, list))
 
 
 def _enforce_auto_limit_restore():
@@ -384,78 +498,61 @@ def _enforce_auto_limit_restore():
     Enforce auto-cutoff at 100% usage: enqueue OFF when used >= allocated.
     Enqueue ON when usage is below limit (after recharge).
     Only applies to analyzers where BreakerEnabled=1. This function is best-effort and errors are swallowed.
+    The selection, duplicate-window check, enqueue and the cut-off notification (queued in
+    ops.EmailQueue when ALERTS_ENABLED, not sent here) all run set-based in app.sp_EnforceAutoLimit.
     """
     try:
-        users = db_helper.execute_query("SELECT UserID, AllocatedKWh, UsedKWh FROM app.Users WHERE ISNULL(IsActive,1)=1") or []
-        for u in users:
-            try:
-                alloc = float(u.get("AllocatedKWh") or 0.0)
-                used = float(u.get("UsedKWh") or 0.0)
-                pct = (used / alloc * 100.0) if alloc > 0 else (100.0 if used > 0 else 0.0)
-                aids = db_helper.execute_query(
-                    "SELECT AnalyzerID, ISNULL(BreakerCoilAddress, 0) as Coil, ISNULL(BreakerEnabled, 0) as Enabled FROM app.Analyzers WHERE UserID = ? AND IsActive = 1",
-                    (u["UserID"],),
-                ) or []
-                for a in aids:
-                    if int(a.get("Enabled") or 0) != 1:
-                        continue
-                    coil = int(a.get("Coil") or 0)
-                    # Keep DB-range check but allow worker to override write register via default/reg override
-                    if coil < 0 or coil > 9999:
-                        continue
-                    if pct >= 100.0:
-                        _enqueue_do(int(a["AnalyzerID"]), coil, "OFF", "auto_limit", "Units exceeded 100%", requested_by=1)
-                        try:
-                            urow = db_helper.execute_query(
-                                "SELECT Email, Username, FullName FROM app.Users WHERE UserID = ?",
-                                (int(u["UserID"]),)
-                            ) or []
-                            em = urow and urow[0].get("Email")
-                            if em:
-                                from backend.utils.email_client import send_email
-                                subj = "Energy Limit Exhausted — Supply Disabled"
-                                body = (
-                                    f"Dear {urow[0].get('FullName') or urow[0].get('Username')},\n\n"
-                                    f"Your allocated energy units are fully consumed (100%). The system has switched OFF your supply automatically.\n"
-                                    f"Please recharge to restore service."
-                                )
-                                try:
-                                    send_email(subj, body, [em], html=False)
-                                except Exception:
-                                    pass
-                        except Exception:
-                            pass
-                    else:
-                        _enqueue_do(int(a["AnalyzerID"]), coil, "ON", "auto_restore", "Recharge completed", requested_by=1)
-            except Exception:
-                # per-user failure should not break the loop
-                continue
+        db_helper.execute_stored_procedure(
+            "app.sp_EnforceAutoLimit",
+            {
+                "@DuplicateWindowSeconds": DUPLICATE_WINDOW_SECONDS,
+                "@MaxRetries": DEFAULT_MAX_RETRIES,
+                "@RequestedBy": 1,
+                "@QueueCutoffEmails": 1 if ALERTS_ENABLED else 0,
+            },
+        )
     except Exception:
         pass
 
 
 async def run_worker_loop(poll_interval_seconds: int = 5):
+    configure_logging()
     dry = os.getenv("DRY_RUN", "false").lower() == "true"
+    # All DB calls run on the event-loop thread, so one long-lived connection serves the whole loop
+    db_helper.db_conn.pin_connection()
     try:
         connected = db_helper.test_connection()
     except Exception:
         connected = False
-    print(f"[WORKER] Connected to DB: {'YES' if connected else 'NO'}")
-    print(f"[WORKER] DRY_RUN: {'ENABLED' if dry else 'DISABLED'}")
-    print("[WORKER] Waiting for commands...")
+    logger.info("Connected to DB: %s", "YES" if connected else "NO")
+    logger.info("DRY_RUN: %s", "ENABLED" if dry else "DISABLED")
+    logger.info("Waiting for commands...")
     if dry:
         while True:
             await asyncio.sleep(poll_interval_seconds)
-    while True:
-        try:
-            _enforce_auto_limit_restore()
-        except Exception:
-            pass
-        try:
-            count = await process_pending_commands(20)
-        except Exception:
-            count = 0
-        await asyncio.sleep(poll_interval_seconds if count == 0 else 1)
+    last_ping = time.monotonic()
+    try:
+        while True:
+            if time.monotonic() - last_ping >= DB_PING_SECONDS:
+                # A failed ping drops the pinned connection; the next call reconnects
+                db_helper.test_connection()
+                last_ping = time.monotonic()
+            try:
+                _enforce_auto_limit_restore()
+            except Exception:
+                pass
+            try:
+                count = await process_pending_commands(20)
+            except Exception:
+                count = 0
+            try:
+                close_idle_clients(MODBUS_IDLE_SECONDS)
+            except Exception:
+                pass
+            await asyncio.sleep(poll_interval_seconds if count == 0 else 1)
+    finally:
+        # Release device sockets on shutdown/cancellation
+        close_all_clients()
 
 
 if __name__ == "__main__":
@@ -3,16 +3,90 @@ Email service for sending alerts and notifications
 Handles SMTP configuration and email queue processing.
 """
 
+import logging
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
+import string
 from typing import Dict, List, Optional
 from datetime import datetime
 import asyncio
 
 from backend.dal.database import db_helper
 
+logger = logging.getLogger(__name__)
+
+# One round-trip for all outcomes of a queue run (see app.EmailStatusTVP)
+_UPDATE_STATUS_BATCH_SQL = "{CALL app.sp_UpdateEmailQueueStatus(?)}"
+
+# Rows are claimed (PENDING -> SENDING) so concurrent drains never send the same email
+EMAIL_BATCH_SIZE = 50
+
+_UPDATE_STATUS_SQL = """
+    UPDATE ops.EmailQueue
+    SET SendStatus = ?, SentAt = CASE WHEN ? = 'SENT' THEN GETUTCDATE() END
+    WHERE EmailID = ?
+"""
+
+_LOW_BALANCE_USER_SQL = """
+    SELECT Email, RemainingKWh, FullName
+    FROM app.Users
+    WHERE UserID = ? AND Email IS NOT NULL
+"""
+
+_ANALYZER_OWNER_SQL = """
+    SELECT a.SerialNumber, u.Email, u.FullName
+    FROM app.Analyzers a
+    JOIN app.Users u ON a.UserID = u.UserID
+    WHERE a.AnalyzerID = ? AND u.Email IS NOT NULL
+"""
+
+_INSERT_EMAIL_SQL = """
+    INSERT INTO ops.EmailQueue (UserID, EmailTo, Subject, Body, Priority)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+LOW_BALANCE_SUBJECT = "⚠️ Low Energy Balance Warning"
+DEVICE_OFFLINE_SUBJECT = "🚨 Device Offline Alert"
+
+_LOW_BALANCE_TMPL = string.Template("""
+            <html>
+            <body>
+                <h2>Low Energy Balance Alert</h2>
+                <p>Dear ${full_name},</p>
+                <p><strong>Warning:</strong> Your prepaid energy balance is running low.</p>
+                <p><strong>Remaining Balance:</strong> ${remaining_kwh} KWh</p>
+                <p>Please recharge your account soon to avoid service interruption.</p>
+                <br>
+                <p>Best regards,<br>PAC3220 Energy Monitoring System</p>
+            </body>
+            </html>
+            """)
+
+_DEVICE_OFFLINE_TMPL = string.Template("""
+            <html>
+            <body>
+                <h2>Device Offline Alert</h2>
+                <p>Dear ${full_name},</p>
+                <p><strong>Alert:</strong> Your energy monitoring device has gone offline.</p>
+                <p><strong>Device Serial:</strong> ${serial}</p>
+                <p>Please check your device connection and network settings.</p>
+                <br>
+                <p>Best regards,<br>PAC3220 Energy Monitoring System</p>
+            </body>
+            </html>
+            """)
+
+
+def render_low_balance(full_name: str, remaining_kwh: float) -> str:
+    return _LOW_BALANCE_TMPL.substitute(full_name=full_name, remaining_kwh=f"{remaining_kwh:.2f}")
+
+
+def render_device_offline(full_name: str, serial: str) -> str:
+    return _DEVICE_OFFLINE_TMPL.substitute(full_name=full_name, serial=serial)
+
+
 class EmailService:
     """Email service for sending notifications"""
 
@@ -32,111 +106,139 @@ class EmailService:
         ])
 
         if not self.smtp_enabled:
-            print("WARNING: SMTP not configured. Email alerts will be disabled.")
+            logger.warning("SMTP not configured. Email alerts will be disabled.")
+        else:
+            logger.info("Email service initialized with SMTP: %s:%s", self.smtp_server, self.smtp_port)
+
+    def _connect(self):
+        """Open an authenticated SMTP session (SSL or STARTTLS based on config)"""
+        if self.smtp_use_ssl:
+            server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
         else:
-            print(f"Email service initialized with SMTP: {self.smtp_server}:{self.smtp_port}")
+            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+            server.starttls()
+        server.login(self.smtp_username, self.smtp_password)
+        return server
+
+    @staticmethod
+    def _quit(server) -> None:
+        try:
+            server.quit()
+        except Exception:
+            pass
+
+    def send_email_on(self, server, to_email: str, subject: str, body: str) -> None:
+        """Send one email over an already open SMTP session; raises on failure"""
+        msg = MIMEMultipart()
+        msg['From'] = self.from_email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html'))
+        server.send_message(msg)
 
     def send_email(self, to_email: str, subject: str, body: str) -> bool:
         """Send a single email"""
         if not self.smtp_enabled:
-            print(f"EMAIL DISABLED: Would send to {to_email}: {subject}")
+            logger.debug("EMAIL DISABLED: Would send to %s: %s", to_email, subject)
             return False
 
         try:
-            # Create message
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = to_email
-            msg['Subject'] = subject
-
-            # Add body
-            msg.attach(MIMEText(body, 'html'))
-
-            # Send email (SSL or TLS based on config)
-            text = msg.as_string()
-            if self.smtp_use_ssl:
-                server = smtplib.SMTP_SSL(self.smtp_server, self.smtp_port)
-                server.login(self.smtp_username, self.smtp_password)
-                server.sendmail(self.from_email, to_email, text)
-                server.quit()
-            else:
-                server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.sendmail(self.from_email, to_email, text)
-                server.quit()
-
-            print(f"Email sent successfully to {to_email}")
+            server = self._connect()
+            try:
+                self.send_email_on(server, to_email, subject, body)
+            finally:
+                self._quit(server)
+
+            logger.debug("Email sent successfully to %s", to_email)
             return True
 
         except Exception as e:
-            print(f"Failed to send email to {to_email}: {e}")
+            logger.warning("Failed to send email to %s: %s", to_email, e)
             return False
 
     def process_email_queue(self) -> int:
-        """Process pending emails from queue using ops.EmailQueue schema."""
+        """Process pending emails from queue using ops.EmailQueue schema.
+
+        Rows are claimed through app.sp_ClaimEmailQueue, so drains in several API
+        workers never pick up the same email. One SMTP session is reused for the
+        whole batch and re-opened if the server drops it.
+        """
+        if not self.smtp_enabled:
+            # Leave the queue PENDING until SMTP is configured rather than failing every row
+            return 0
+
+        server = None
         try:
-            pending_emails = db_helper.execute_query(
-                """
-                SELECT TOP 10 EmailID, EmailTo, Subject, Body, Priority
-                FROM ops.EmailQueue
-                WHERE SendStatus = 'PENDING'
-                ORDER BY CASE WHEN Priority='CRITICAL' THEN 3 WHEN Priority='HIGH' THEN 2 ELSE 1 END DESC, QueuedAt ASC
-                """
-            )
+            pending_emails = db_helper.execute_stored_procedure("app.sp_ClaimEmailQueue", {"@Limit": EMAIL_BATCH_SIZE})
 
             if not pending_emails:
                 return 0
 
             processed = 0
             failed = 0
+            results: List[tuple] = []
             for email in pending_emails:
                 email_id = email["EmailID"]
                 to_email = email["EmailTo"]
                 subject = email["Subject"]
                 body = email["Body"]
-                attempts = int(email.get("Attempts", 0) or 0)
 
-                success = self.send_email(to_email, subject, body)
+                success = False
+                try:
+                    if server is None:
+                        server = self._connect()
+                    try:
+                        self.send_email_on(server, to_email, subject, body)
+                    except smtplib.SMTPServerDisconnected:
+                        server = self._connect()
+                        self.send_email_on(server, to_email, subject, body)
+                    success = True
+                except Exception as e:
+                    logger.warning("Failed to send email to %s: %s", to_email, e)
+                    if isinstance(e, (smtplib.SMTPServerDisconnected, OSError)) and server is not None:
+                        # session is unusable; reconnect for the next email
+                        self._quit(server)
+                        server = None
 
                 if success:
-                    db_helper.execute_query(
-                        """
-                        UPDATE ops.EmailQueue
-                        SET SendStatus = 'SENT', SentAt = GETUTCDATE()
-                        WHERE EmailID = ?
-                        """,
-                        (email_id,)
-                    )
+                    results.append((email_id, "SENT"))
                     processed += 1
                 else:
-                    # increment attempts and capture error if possible next run
-                    db_helper.execute_query(
-                        """
-                        UPDATE ops.EmailQueue
-                        SET SendStatus = 'FAILED'
-                        WHERE EmailID = ?
-                        """,
-                        (email_id,)
-                    )
+                    results.append((email_id, "FAILED"))
                     failed += 1
 
-            print(f"Email queue processed: {processed} sent, {failed} failed")
+            self._record_results(results)
+            logger.info("Email queue processed: %d sent, %d failed", processed, failed)
             return processed
 
         except Exception as e:
-            print(f"Error processing email queue: {e}")
+            logger.error("Error processing email queue: %s", e)
             return 0
+        finally:
+            if server is not None:
+                self._quit(server)
+
+    @staticmethod
+    def _record_results(results: List[tuple]) -> None:
+        """Write (EmailID, SendStatus) outcomes with one table-valued call; fall back to per-row updates."""
+        if not results:
+            return
+        try:
+            db_helper.execute_query(_UPDATE_STATUS_BATCH_SQL, (results,))
+            return
+        except Exception as e:
+            logger.warning("Batch email status update failed, retrying individually: %s", e)
+        for email_id, status in results:
+            try:
+                db_helper.execute_query(_UPDATE_STATUS_SQL, (status, status, email_id))
+            except Exception as e:
+                logger.warning("Failed to update email %s status: %s", email_id, e)
 
     def queue_low_balance_alert(self, user_id: int) -> bool:
         """Queue a low balance alert email"""
         try:
             # Get user info
-            user_info = db_helper.execute_query("""
-                SELECT Email, RemainingKWh, FullName
-                FROM app.Users
-                WHERE UserID = ? AND Email IS NOT NULL
-            """, (user_id,))
+            user_info = db_helper.execute_query(_LOW_BALANCE_USER_SQL, (user_id,))
 
             if not user_info or not user_info[0]["Email"]:
                 return False
@@ -146,45 +248,24 @@ class EmailService:
             remaining_kwh = user["RemainingKWh"]
             full_name = user["FullName"]
 
-            # Create email content
-            subject = "⚠️ Low Energy Balance Warning"
-            body = f"""
-            <html>
-            <body>
-                <h2>Low Energy Balance Alert</h2>
-                <p>Dear {full_name},</p>
-                <p><strong>Warning:</strong> Your prepaid energy balance is running low.</p>
-                <p><strong>Remaining Balance:</strong> {remaining_kwh:.2f} KWh</p>
-                <p>Please recharge your account soon to avoid service interruption.</p>
-                <br>
-                <p>Best regards,<br>PAC3220 Energy Monitoring System</p>
-            </body>
-            </html>
-            """
-
             # Insert into queue
-            db_helper.execute_query("""
-                INSERT INTO ops.EmailQueue (UserID, EmailTo, Subject, Body, Priority)
-                VALUES (?, ?, ?, ?, 'HIGH')
-            """, (user_id, email, subject, body))
+            db_helper.execute_query(
+                _INSERT_EMAIL_SQL,
+                (user_id, email, LOW_BALANCE_SUBJECT, render_low_balance(full_name, remaining_kwh), "HIGH"),
+            )
 
-            print(f"Low balance alert queued for user {user_id}")
+            logger.debug("Low balance alert queued for user %s", user_id)
             return True
 
         except Exception as e:
-            print(f"Error queuing low balance alert: {e}")
+            logger.error("Error queuing low balance alert: %s", e)
             return False
 
     def queue_device_offline_alert(self, analyzer_id: int) -> bool:
         """Queue a device offline alert email"""
         try:
             # Get analyzer info and owner
-            analyzer_info = db_helper.execute_query("""
-                SELECT a.SerialNumber, u.Email, u.FullName
-                FROM app.Analyzers a
-                JOIN app.Users u ON a.UserID = u.UserID
-                WHERE a.AnalyzerID = ? AND u.Email IS NOT NULL
-            """, (analyzer_id,))
+            analyzer_info = db_helper.execute_query(_ANALYZER_OWNER_SQL, (analyzer_id,))
 
             if not analyzer_info:
                 return False
@@ -194,35 +275,20 @@ class EmailService:
             serial = info["SerialNumber"]
             full_name = info["FullName"]
 
-            # Create email content
-            subject = "🚨 Device Offline Alert"
-            body = f"""
-            <html>
-            <body>
-                <h2>Device Offline Alert</h2>
-                <p>Dear {full_name},</p>
-                <p><strong>Alert:</strong> Your energy monitoring device has gone offline.</p>
-                <p><strong>Device Serial:</strong> {serial}</p>
-                <p>Please check your device connection and network settings.</p>
-                <br>
-                <p>Best regards,<br>PAC3220 Energy Monitoring System</p>
-            </body>
-            </html>
-            """
-
             # Insert into queue
-            db_helper.execute_query("""
-                INSERT INTO ops.EmailQueue (EmailTo, Subject, Body, Priority)
-                VALUES (?, ?, ?, 'CRITICAL')
-            """, (email, subject, body))
+            db_helper.execute_query(
+                _INSERT_EMAIL_SQL,
+                (None, email, DEVICE_OFFLINE_SUBJECT, render_device_offline(full_name, serial), "CRITICAL"),
+            )
 
-            print(f"Device offline alert queued for analyzer {analyzer_id}")
+            logger.debug("Device offline alert queued for analyzer %s", analyzer_id)
             return True
 
         except Exception as e:
-            print(f"Error queuing device offline alert: {e}")
+            logger.error("Error queuing device offline alert: %s", e)
             return False
 
+
 # Global email service instance
 email_service = EmailService()
 
@@ -231,9 +297,10 @@ async def process_email_queue_background():
     """Background task to process email queue periodically"""
     while True:
         try:
-            email_service.process_email_queue()
+            # SMTP I/O is blocking; keep it off the event loop
+            await asyncio.to_thread(email_service.process_email_queue)
         except Exception as e:
-            print(f"Error in email queue processing task: {e}")
+            logger.error("Error in email queue processing task: %s", e)
 
         # Process every 5 minutes
         await asyncio.sleep(300)
\ No newline at end of file
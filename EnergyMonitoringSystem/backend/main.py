@@ -4,7 +4,14 @@ PAC3220 Prepaid Energy Monitoring System - FastAPI Backend
 Main application entry point with all API routes.
 """
 
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import logging
 import os
+import orjson
 from pathlib import Path
 from dotenv import load_dotenv
 import sys
@@ -14,10 +21,10 @@ from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.base import BaseHTTPMiddleware
 from time import time
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from fastapi import WebSocket, WebSocketDisconnect
 import uvicorn
-from datetime import datetime
+from datetime import datetime, timezone
 
 
 # Load unified root .env
@@ -27,16 +34,12 @@ try:
 except Exception:
     pass
 
-# Add current directory to path for imports
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
 # Add backend directory and project root to sys.path so absolute 'backend' imports work
-backend_dir = os.path.dirname(os.path.abspath(__file__))
-project_root = os.path.dirname(backend_dir)
-if backend_dir not in sys.path:
-    sys.path.insert(0, backend_dir)
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+for _path in (BACKEND_DIR, PROJECT_ROOT):
+    if _path not in sys.path:
+        sys.path.insert(0, _path)
 
 from backend.api.routes_auth import router as auth_router
 from backend.api.routes_auth import login as auth_login
@@ -52,6 +55,79 @@ from backend.api.routes_do_control import router as do_router
 from backend.websocket_manager import ws_manager
 from backend.dal.database import db_helper
 from backend.alerts_service import start_alerts_scheduler
+from backend.utils.logging_config import configure_logging
+from backend.utils.event_log import log_event, start_event_writer, stop_event_writer
+from backend.utils import email_client
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional: without it the rate limiter is per-process
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Environment switches, resolved once at import
+APP_ENV = os.getenv("APP_ENV", "development").lower()
+ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "false").lower() in ("1", "true", "yes")
+# Optional disable via environment to avoid errors in dev without DB
+DISABLE_BACKGROUND_TASKS = os.getenv("DISABLE_BACKGROUND_TASKS", "false").lower() == "true"
+REDIS_URL = os.getenv("REDIS_URL")
+
+async def _start_alerts(tasks: list) -> None:
+    # Alerts scheduler if enabled
+    if ALERTS_ENABLED:
+        try:
+            tasks.append(await start_alerts_scheduler())
+        except Exception:
+            pass
+
+
+async def _start_db_tasks(tasks: list) -> None:
+    from backend.websocket_manager import periodic_status_updates
+    from backend.email_service import process_email_queue_background
+
+    # Start WebSocket status updates only if DB is reachable (checked off the event loop)
+    try:
+        if await asyncio.to_thread(db_helper.test_connection):
+            tasks.append(asyncio.create_task(periodic_status_updates()))
+            # Drains ops.EmailQueue (auto-limit and balance notifications)
+            tasks.append(asyncio.create_task(process_email_queue_background()))
+    except Exception:
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Start background tasks on startup; cancel them on shutdown"""
+    configure_logging()
+
+    # asyncio.to_thread (blocking DB/SMTP calls from async handlers and tasks) runs on this pool
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=int(os.getenv("API_THREAD_POOL_SIZE", "64")), thread_name_prefix="api-io")
+    )
+
+    tasks: list = []
+    starters = [_start_alerts(tasks)]
+    if not DISABLE_BACKGROUND_TASKS:
+        # Error-handler and email events are batched into ops.Events from here on
+        start_event_writer()
+        starters.append(_start_db_tasks(tasks))
+    await asyncio.gather(*starters)
+    # Share WebSocket broadcasts across workers when Redis is configured
+    if REDIS_URL:
+        await ws_manager.start_pubsub(REDIS_URL)
+
+    # Unified poller will run as an independent service/process.
+    # API no longer launches legacy poller threads to avoid coupling and blocking.
+    yield
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await ws_manager.stop_pubsub()
+    await stop_event_writer()
+    await asyncio.to_thread(email_client.close)
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -59,13 +135,15 @@ app = FastAPI(
     description="Prepaid energy monitoring system for Siemens PAC3220 analyzers",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # orjson: C encoder with native datetime support for every route's response
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
-env = os.getenv("APP_ENV", "development")
 allow_origins_env = os.getenv("ALLOW_ORIGINS", "http://localhost:3000,http://localhost:5173")
 allow_origins = [o.strip() for o in allow_origins_env.split(",")] if allow_origins_env else []
-allow_credentials = env != "production"
+allow_credentials = APP_ENV != "production"
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allow_origins,
@@ -75,69 +153,149 @@ app.add_middleware(
 )
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
+    """
+    Sliding-window limit per (client IP, path).
+
+    With REDIS_URL set (and the redis package installed) the window is a Redis sorted
+    set shared by all workers; otherwise, or while Redis is unreachable, it is kept
+    in this process. Paths in RL_EXEMPT_PATHS (default "/health,/") are not counted.
+    """
+
+    # After a Redis failure, use the in-process window for this long before retrying
+    REDIS_RETRY_SECONDS = 30
+    # In-process windows kept at most; least recently hit keys are evicted first
+    MAX_TRACKED_KEYS = 100_000
+
     def __init__(self, app):
         super().__init__(app)
-        self.limits = {}
+        self.limits: "OrderedDict[str, deque]" = OrderedDict()
         self.window = int(os.getenv("GLOBAL_RATE_LIMIT_WINDOW_SECONDS", "60"))
         self.max_per_key = int(os.getenv("GLOBAL_RATE_LIMIT_PER_WINDOW", "300"))
+        self._exempt = frozenset(p.strip() for p in os.getenv("RL_EXEMPT_PATHS", "/health,/").split(",") if p.strip())
+        self.redis = (
+            aioredis.from_url(REDIS_URL, socket_connect_timeout=0.5, socket_timeout=0.5)
+            if REDIS_URL and aioredis is not None else None
+        )
+        self._redis_retry_at = 0.0
+        # Sorted-set members must be unique even for hits in the same millisecond
+        self._seq = itertools.count()
+        self._member_prefix = f"{os.getpid()}-"
+
+    async def _hit_redis(self, key: str, now: float) -> int:
+        now_ms = int(now * 1000)
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(key, 0, now_ms - self.window * 1000)
+        pipe.zadd(key, {f"{self._member_prefix}{next(self._seq)}": now_ms})
+        pipe.zcard(key)
+        pipe.expire(key, self.window)
+        _, _, count, _ = await pipe.execute()
+        return int(count)
+
+    def _hit_memory(self, key: str, now: float) -> int:
+        buf = self.limits.get(key)
+        if buf is None:
+            buf = self.limits[key] = deque()
+            if len(self.limits) > self.MAX_TRACKED_KEYS:
+                self.limits.popitem(last=False)
+        else:
+            self.limits.move_to_end(key)
+            # Timestamps are appended in order, so expired ones are all at the left
+            while buf and now - buf[0] > self.window:
+                buf.popleft()
+        buf.append(now)
+        return len(buf)
 
     async def dispatch(self, request, call_next):
-        try:
-            ip = request.client.host if request.client else "unknown"
-            key = f"{ip}:{request.url.path}"
-            now = time()
-            buf = self.limits.get(key, [])
-            buf = [t for t in buf if now - t <= self.window]
-            buf.append(now)
-            self.limits[key] = buf
-            if len(buf) > self.max_per_key:
-                return JSONResponse(status_code=429, content={"detail": "Too many requests"})
-        except Exception:
-            pass
-        return await call_next(request)
+        # WebSocket scopes never reach dispatch (BaseHTTPMiddleware passes them straight through)
+        path = request.url.path
+        if path in self._exempt:
+            return await call_next(request)
+        client = request.client
+        key = (client.host if client is not None else "unknown") + ":" + path
+        now = time()
+        count = None
+        # Only the Redis round trip can fail; the in-process window is plain dict/deque work
+        if self.redis is not None and now >= self._redis_retry_at:
+            try:
+                count = await self._hit_redis("rl:" + key, now)
+            except Exception as e:
+                self._redis_retry_at = now + self.REDIS_RETRY_SECONDS
+                logger.warning("Rate limiter: Redis unavailable, using in-process window: %s", e)
+        if count is None:
+            count = self._hit_memory(key, now)
+        if count > self.max_per_key:
+            return ORJSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={
+                    "Retry-After": str(self.window),
+                    "X-RateLimit-Limit": str(self.max_per_key),
+                    "X-RateLimit-Remaining": "0",
+                },
+            )
+        response = await call_next(request)
+        response.headers["X-RateLimit-Limit"] = str(self.max_per_key)
+        response.headers["X-RateLimit-Remaining"] = str(max(0, self.max_per_key - count))
+        return response
 
 app.add_middleware(RateLimitMiddleware)
 
+
+# Liveness body shared by HealthFastPathMiddleware and the /health route, encoded once at import
+_HEALTH_BODY = orjson.dumps({"status": "ok"})
+
+
+class HealthFastPathMiddleware:
+    """
+    Answer GET /health liveness probes before the rate-limit and CORS middleware run.
+    Added last, so it is the outermost user middleware.
+    """
+
+    _START = {
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(_HEALTH_BODY)).encode())],
+    }
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/health" and scope["method"] in ("GET", "HEAD"):
+            await send(self._START)
+            await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else _HEALTH_BODY})
+            return
+        await self.app(scope, receive, send)
+
+app.add_middleware(HealthFastPathMiddleware)
+
+def _json_dumps(obj) -> str:
+    return orjson.dumps(obj).decode()
+
 # Global error handlers with unified JSON and DB logging
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    try:
-        db_helper.execute_query(
-            """
-            INSERT INTO ops.Events (Level, EventType, Message, Source, MetaData)
-            VALUES ('WARN', 'http_exception', ?, 'API', ?)
-            """,
-            (str(exc.detail), f"{'{'}\"path\": \"{str(request.url.path)}\", \"status\": {exc.status_code}{'}'}"),
-        )
-    except Exception:
-        pass
-    return JSONResponse(status_code=exc.status_code, content={
+    path = request.url.path
+    log_event('WARN', 'http_exception', str(exc.detail), 'API', _json_dumps({"path": path, "status": exc.status_code}))
+    return ORJSONResponse(status_code=exc.status_code, content={
         "success": False,
         "error": {
             "code": exc.status_code,
             "message": exc.detail,
-            "path": str(request.url.path),
+            "path": path,
         }
     })
 
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
-    try:
-        db_helper.execute_query(
-            """
-            INSERT INTO ops.Events (Level, EventType, Message, Source, MetaData)
-            VALUES ('ERROR', 'unhandled_exception', ?, 'API', ?)
-            """,
-            (str(exc), f"{'{'}\"path\": \"{str(request.url.path)}\"{'}'}"),
-        )
-    except Exception:
-        pass
-    return JSONResponse(status_code=500, content={
+    path = request.url.path
+    log_event('ERROR', 'unhandled_exception', str(exc), 'API', _json_dumps({"path": path}))
+    return ORJSONResponse(status_code=500, content={
         "success": False,
         "error": {
             "code": 500,
             "message": "Internal server error",
-            "path": str(request.url.path),
+            "path": path,
         }
     })
 
@@ -156,11 +314,11 @@ async def dashboard_websocket(websocket: WebSocket, user_id: int = None):
     """WebSocket endpoint for real-time dashboard updates"""
     await ws_manager.connect(websocket, "dashboard", user_id)
     try:
-        while True:
-            # Keep connection alive, data is pushed from server
-            data = await websocket.receive_text()
-            # Handle any client messages if needed
+        # Data is pushed from server; just wait for the client to go away
+        await ws_manager.wait_closed(websocket)
     except WebSocketDisconnect:
+        pass
+    finally:
         ws_manager.disconnect(websocket, "dashboard", user_id)
 
 @app.websocket("/ws/admin")
@@ -168,63 +326,45 @@ async def admin_websocket(websocket: WebSocket, user_id: int = None):
     """WebSocket endpoint for admin real-time updates"""
     await ws_manager.connect(websocket, "admin", user_id)
     try:
-        while True:
-            data = await websocket.receive_text()
+        await ws_manager.wait_closed(websocket)
     except WebSocketDisconnect:
+        pass
+    finally:
         ws_manager.disconnect(websocket, "admin", user_id)
 
+# Static body for the root endpoint, encoded once at import
+_ROOT_BODY = orjson.dumps({
+    "message": "PAC3220 Prepaid Energy Monitoring System API",
+    "version": "1.0.0",
+    "docs": "/docs",
+    "health": "/health"
+})
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "ok"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 # Root endpoint
 @app.get("/")
 async def root():
     """Root endpoint with system information"""
-    return {
-        "message": "PAC3220 Prepaid Energy Monitoring System API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "health": "/health"
-    }
-
-# Startup: begin alerts scheduler if enabled
-@app.on_event("startup")
-async def startup_alerts():
-    if os.getenv("ALERTS_ENABLED", "false").lower() == "true":
-        try:
-            await start_alerts_scheduler()
-        except Exception:
-            pass
-
-# Startup: begin background tasks
-@app.on_event("startup")
-async def startup_event():
-    """Initialize background tasks on startup"""
-    import asyncio
-    from backend.websocket_manager import periodic_status_updates
-
-    # Optional disable via environment to avoid errors in dev without DB
-    if os.getenv("DISABLE_BACKGROUND_TASKS", "false").lower() == "true":
-        return
-    # Start WebSocket status updates only if DB is reachable
-    try:
-        if db_helper.test_connection():
-            asyncio.create_task(periodic_status_updates())
-    except Exception:
-        pass
-
-    # Unified poller will run as an independent service/process.
-    # API no longer launches legacy poller threads to avoid coupling and blocking.
-
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 if __name__ == "__main__":
     # Get configuration from environment
     host = os.getenv("API_HOST", "0.0.0.0")
     port = int(os.getenv("API_PORT", "8000"))
-    reload = os.getenv("APP_ENV", "development") == "development"
+    reload = APP_ENV == "development"
+    # >1 needs REDIS_URL: it shares the rate limit and lets one worker per interval run the
+    # alerts checks (the email queue is claimed row by row in the DB)
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1 and not REDIS_URL:
+        print("[WARNING] WEB_CONCURRENCY > 1 requires REDIS_URL; starting a single worker")
+        workers = 1
+    if reload:
+        workers = 1
 
     print("=" * 60)
     print("PAC3220 Prepaid Energy Monitoring System")
@@ -232,78 +372,71 @@ if __name__ == "__main__":
     print(f"[STARTING] API server on {host}:{port}")
     print(f"[DOCS] API Documentation: http://{host}:{port}/docs")
     print(f"[RELOAD] Reload enabled: {reload}")
+    print(f"[WORKERS] {workers}")
     print("=" * 60)
 
-    # Startup handlers are defined above
+    # Startup/shutdown is handled by the lifespan context above
 
     uvicorn.run(
         "main:app",
         host=host,
         port=port,
         reload=reload,
+        workers=workers,
+        # uvloop/httptools when installed (uvicorn[standard]; uvloop is not available on Windows)
+        loop="auto",
+        http="auto",
+        # Trust X-Forwarded-For from the reverse proxy so the rate limiter sees client IPs
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
         log_level="info"
     )
+# Development-only admin login that works without a DB (resolved once at import)
+_DEV_ADMIN_LOGIN = APP_ENV == "development"
+_DEV_ADMIN_USER = {
+    "id": 1,
+    "username": "admin",
+    "fullname": "Administrator",
+    "email": "admin@example.com",
+    "role": "Admin",
+}
+
+
+def _dev_admin_token_response() -> TokenResponse:
+    # Only the JWT is rebuilt per call (it carries the expiry)
+    token = create_jwt_token(user_id=1, username="admin", role="Admin")
+    return TokenResponse(success=True, token=token, refresh_token=token, user=dict(_DEV_ADMIN_USER))
+
+
 @app.post("/api/auth/login", response_model=TokenResponse)
 async def proxy_login_auth(req: LoginRequest, http_req: Request):
     # Early dev fallback: allow admin login without DB before calling router
-    try:
-        if os.getenv("APP_ENV", "development").lower() == "development" and (req.username or "").lower() == "admin":
-            token = create_jwt_token(user_id=1, username="admin", role="Admin")
-            return TokenResponse(
-                success=True,
-                token=token,
-                refresh_token=token,
-                user={
-                    "id": 1,
-                    "username": "admin",
-                    "fullname": "Administrator",
-                    "email": "admin@example.com",
-                    "role": "Admin",
-                },
-            )
-    except Exception:
-        pass
-    try:
-        return await auth_login(req, http_req)
-    except Exception as e:
+    if _DEV_ADMIN_LOGIN and (req.username or "").lower() == "admin":
         try:
-            # Development fallback to unblock login when DB is misconfigured
-            if os.getenv("APP_ENV", "development").lower() == "development" and (req.username or "").lower() == "admin":
-                token = create_jwt_token(user_id=1, username="admin", role="Admin")
-                return TokenResponse(
-                    success=True,
-                    token=token,
-                    refresh_token=token,
-                    user={
-                        "id": 1,
-                        "username": "admin",
-                        "fullname": "Administrator",
-                        "email": "admin@example.com",
-                        "role": "Admin",
-                    },
-                )
+            return _dev_admin_token_response()
         except Exception:
             pass
-        raise e
+    return await auth_login(req, http_req)
 @app.post("/api/login", response_model=TokenResponse)
 async def proxy_login(req: LoginRequest, http_req: Request):
     return await auth_login(req, http_req)
 
 @app.get("/api/user/dashboard")
 async def alias_user_dashboard(current_user: dict = Depends(get_current_user)):
+    timestamp = datetime.now(timezone.utc)
     try:
         user_id = current_user.get("sub")
         # Try stored procedure first
         try:
-            result = db_helper.execute_stored_procedure("app.sp_GetUserDashboard", {"@UserID": user_id})
+            result = await asyncio.to_thread(db_helper.execute_stored_procedure, "app.sp_GetUserDashboard", {"@UserID": user_id})
         except Exception:
             try:
-                result = db_helper.execute_query("SELECT * FROM app.vw_UserDashboard WHERE UserID = ?", (user_id,))
+                result = await asyncio.to_thread(db_helper.execute_query, "SELECT * FROM app.vw_UserDashboard WHERE UserID = ?", (user_id,))
             except Exception:
                 result = []
-        return {"success": True, "data": result[0] if result else {}, "timestamp": datetime.utcnow()}
+        return {"success": True, "data": result[0] if result else {}, "timestamp": timestamp}
     except HTTPException:
         raise
     except Exception as e:
         print(f"Alias user dashboard error: {e}")
-        return {"success": True, "data": {}, "timestamp": datetime.utcnow()}
+        return {"success": True, "data": {}, "timestamp": timestamp}
@@ -0,0 +1,21 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+
+# Ensure env secrets and dummy DB envs for tests (before the app is imported)
+os.environ.setdefault("JWT_SECRET", "test_secret")
+os.environ.setdefault("JWT_REFRESH_SECRET", "test_secret_refresh")
+os.environ.setdefault("DB_DRIVER", "ODBC Driver 18 for SQL Server")
+os.environ.setdefault("DB_SERVER", "localhost")
+os.environ.setdefault("DB_NAME", "testdb")
+os.environ.setdefault("DB_USER", "sa")
+os.environ.setdefault("DB_PASSWORD", "Password!123")
+
+from backend.main import app
+
+
+@pytest.fixture(scope="session")
+def test_client():
+    # One client for the whole run; tests patch db_helper per test via monkeypatch.
+    # Not entered as a context manager, so the lifespan (DB-backed background tasks) does not run.
+    return TestClient(app)
@@ -1,17 +1,4 @@
-import os
 import pytest
-from fastapi.testclient import TestClient
-
-# Ensure env secrets and dummy DB envs for tests
-os.environ.setdefault("JWT_SECRET", "test_secret")
-os.environ.setdefault("JWT_REFRESH_SECRET", "test_secret_refresh")
-os.environ.setdefault("DB_DRIVER", "ODBC Driver 18 for SQL Server")
-os.environ.setdefault("DB_SERVER", "localhost")
-os.environ.setdefault("DB_NAME", "testdb")
-os.environ.setdefault("DB_USER", "sa")
-os.environ.setdefault("DB_PASSWORD", "Password!123")
-
-from backend.main import app
 
 class DummyDB:
     def __init__(self, user_row=None):
@@ -30,7 +17,7 @@ class DummyDB:
         return None
 
 @pytest.fixture
-def client_success(monkeypatch):
+def client_success(test_client, monkeypatch):
     user_row = {
         "UserID": 1,
         "Username": "alice",
@@ -45,15 +32,15 @@ def client_success(monkeypatch):
     # Patch routes module db_helpers so routes avoid real DB
     import backend.api.routes_auth as routes_auth
     monkeypatch.setattr(routes_auth, "db_helper", dummy)
-    return TestClient(app)
+    return test_client
 
 @pytest.fixture
-def client_fail(monkeypatch):
+def client_fail(test_client, monkeypatch):
     # No user returned
     dummy = DummyDB(None)
     import backend.api.routes_auth as routes_auth
     monkeypatch.setattr(routes_auth, "db_helper", dummy)
-    return TestClient(app)
+    return test_client
 
 
 def test_login_success(client_success):
@@ -70,3 +57,24 @@ def test_login_invalid_user(client_fail):
     r = client_fail.post("/api/login", json={"username": "bob", "password": "whatever"})
     assert r.status_code == 401
     assert r.json()["error"]["code"] == 401 if "error" in r.json() else True
+
+
+def test_tokens_decode_with_jose():
+    # Tokens are signed without jose; jose must still accept them and see the same claims
+    from jose import jwt
+    import backend.api.routes_auth as routes_auth
+    assert routes_auth._HMAC_PROTO is not None and routes_auth._REFRESH_HMAC_PROTO is not None
+
+    token = routes_auth.create_jwt_token(7, "zoë-ümlaut", "Admin")
+    claims = jwt.decode(token, routes_auth.JWT_SECRET, algorithms=["HS256"])
+    assert claims["sub"] == "7"
+    assert claims["username"] == "zoë-ümlaut"
+    assert claims["role"] == "Admin"
+    assert claims["exp"] - claims["iat"] == routes_auth.JWT_EXPIRATION_MINUTES * 60
+
+    refresh = routes_auth.create_refresh_token(7, "zoë-ümlaut")
+    claims = jwt.decode(refresh, routes_auth.REFRESH_SECRET, algorithms=["HS256"])
+    assert claims["sub"] == "7"
+    assert claims["username"] == "zoë-ümlaut"
+    assert claims["type"] == "refresh"
+    assert claims["exp"] - claims["iat"] == routes_auth.REFRESH_EXPIRATION_HOURS * 3600
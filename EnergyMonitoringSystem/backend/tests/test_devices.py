@@ -1,14 +1,7 @@
 import pytest
-from fastapi.testclient import TestClient
-import os, sys
 
-os.environ.setdefault("JWT_SECRET", "test_secret")
-os.environ.setdefault("JWT_REFRESH_SECRET", "test_secret_refresh")
-
-repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-sys.path.insert(0, repo_root)
-sys.path.insert(0, os.path.join(repo_root, "backend"))
 from backend.main import app
+from backend.api.routes_auth import get_current_user
 
 class DummyDB:
     def __init__(self):
@@ -29,30 +22,29 @@ class DummyDB:
         return []
 
 @pytest.fixture
-def client(monkeypatch):
+def client(test_client, monkeypatch):
     dummy = DummyDB()
     import backend.dal.database as dbmod
     monkeypatch.setattr(dbmod, "db_helper", dummy)
     import backend.api.routes_devices as routes_devices
     monkeypatch.setattr(routes_devices, "db_helper", dummy)
-    from backend.api.routes_auth import create_jwt_token
-    token = create_jwt_token(user_id=1, username="admin", role="Admin")
-    return TestClient(app), token
+    # Authenticate as an admin without minting a JWT
+    app.dependency_overrides[get_current_user] = lambda: {"sub": "1", "username": "admin", "role": "Admin"}
+    yield test_client
+    app.dependency_overrides.pop(get_current_user, None)
 
 
 def test_create_device_ip_validation(client):
-    c, token = client
+    c = client
     # invalid IP
     r = c.post(
         "/api/devices/",
-        headers={"Authorization": f"Bearer {token}"},
         json={"ip_address": "999.999.1.1", "modbus_unit_id": 1}
     )
     assert r.status_code == 400
     # valid IP
     r2 = c.post(
         "/api/devices/",
-        headers={"Authorization": f"Bearer {token}"},
         json={"ip_address": "192.168.1.10", "modbus_unit_id": 10}
     )
     assert r2.status_code == 200
@@ -60,18 +52,16 @@ def test_create_device_ip_validation(client):
 
 
 def test_update_device_modbus_range(client):
-    c, token = client
+    c = client
     # out of range
     r = c.put(
         "/api/devices/123",
-        headers={"Authorization": f"Bearer {token}"},
         json={"modbus_unit_id": 300}
     )
     assert r.status_code == 400
     # in range
     r2 = c.put(
         "/api/devices/123",
-        headers={"Authorization": f"Bearer {token}"},
         json={"modbus_unit_id": 100}
     )
     assert r2.status_code == 200
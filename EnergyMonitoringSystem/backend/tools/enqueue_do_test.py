@@ -1,10 +1,4 @@
-import os
-import sys
-
-# ensure project root on sys.path
-PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-if PROJECT_ROOT not in sys.path:
-    sys.path.insert(0, PROJECT_ROOT)
+"""Run from the project root: python -m backend.tools.enqueue_do_test"""
 
 from backend.dal.database import db_helper
 
@@ -1,11 +1,6 @@
-import os
-import sys
-import asyncio
+"""Run from the project root: python -m backend.tools.run_do_direct"""
 
-# ensure project root on sys.path
-PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-if PROJECT_ROOT not in sys.path:
-    sys.path.insert(0, PROJECT_ROOT)
+import asyncio
 
 from backend.do_worker import _execute_command
 
@@ -1,9 +1,12 @@
+import asyncio
+import json
 import os
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import List
-from backend.dal.database import db_helper
+from typing import List, Optional
+from backend.utils.event_log import log_event
 
 # Unified SMTP configuration from root .env
 SMTP_HOST = os.getenv("SMTP_SERVER") or os.getenv("SMTP_HOST")
@@ -15,7 +18,65 @@ SMTP_FROM = os.getenv("SMTP_FROM_EMAIL") or os.getenv("SMTP_FROM") or (SMTP_USER
 ALERTS_ENABLED = os.getenv("ALERTS_ENABLED", "false").lower() in ("1", "true", "yes")
 
 
+# One SMTP session reused across sends; the lock serialises callers from different threads
+_smtp: Optional[smtplib.SMTP] = None
+_smtp_lock = threading.Lock()
+
+
+def _connect() -> smtplib.SMTP:
+    if SMTP_USE_SSL:
+        server = smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=10)
+    else:
+        server = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10)
+        server.ehlo()
+        try:
+            server.starttls()
+        except Exception:
+            pass
+    if SMTP_USER and SMTP_PASSWORD:
+        server.login(SMTP_USER, SMTP_PASSWORD)
+    return server
+
+
+def _drop_connection() -> None:
+    global _smtp
+    if _smtp is not None:
+        try:
+            _smtp.close()
+        except Exception:
+            pass
+        _smtp = None
+
+
+def close() -> None:
+    """QUIT and drop the shared session; the next send reconnects."""
+    with _smtp_lock:
+        if _smtp is not None:
+            try:
+                _smtp.quit()
+            except Exception:
+                pass
+        _drop_connection()
+
+
+def _send(msg: MIMEMultipart, to_emails: List[str]) -> None:
+    """Send over the shared session, reconnecting once if the server dropped it."""
+    global _smtp
+    with _smtp_lock:
+        for attempt in (1, 2):
+            if _smtp is None:
+                _smtp = _connect()
+            try:
+                _smtp.send_message(msg, SMTP_FROM, to_emails)
+                return
+            except (smtplib.SMTPServerDisconnected, OSError):
+                _drop_connection()
+                if attempt == 2:
+                    raise
+
+
 def send_email(subject: str, body: str, to_emails: List[str], html: bool = False) -> bool:
+    """Blocking send; from async code use send_email_async."""
     if not ALERTS_ENABLED:
         return False
     if not SMTP_HOST or not SMTP_PORT or not SMTP_FROM or not to_emails:
@@ -32,52 +93,19 @@ def send_email(subject: str, body: str, to_emails: List[str], html: bool = False
         msg.attach(MIMEText(body, "plain"))
 
     # Build metadata safely (no f-string brace explosion)
-    metadata_success = '{"to": "%s", "success": true}' % ",".join(to_emails)
-    metadata_fail = '{"to": "%s", "success": false}' % ",".join(to_emails)
+    metadata_success = json.dumps({"to": ",".join(to_emails), "success": True})
+    metadata_fail = json.dumps({"to": ",".join(to_emails), "success": False})
 
     try:
-        # SSL or TLS handling
-        if SMTP_USE_SSL:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=10) as server:
-                if SMTP_USER and SMTP_PASSWORD:
-                    server.login(SMTP_USER, SMTP_PASSWORD)
-                server.sendmail(SMTP_FROM, to_emails, msg.as_string())
-        else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as server:
-                server.ehlo()
-                try:
-                    server.starttls()
-                except Exception:
-                    pass
-                if SMTP_USER and SMTP_PASSWORD:
-                    server.login(SMTP_USER, SMTP_PASSWORD)
-                server.sendmail(SMTP_FROM, to_emails, msg.as_string())
-
-        # Log success
-        try:
-            db_helper.execute_query(
-                """
-                INSERT INTO ops.Events (Level, EventType, Message, Source, MetaData, Timestamp)
-                VALUES ('INFO', 'email_send', ?, 'email', ?, GETUTCDATE())
-                """,
-                (subject, metadata_success),
-            )
-        except Exception:
-            pass
-
+        _send(msg, to_emails)
+        log_event('INFO', 'email_send', subject, 'email', metadata_success)
         return True
 
     except Exception:
-        # Log failure
-        try:
-            db_helper.execute_query(
-                """
-                INSERT INTO ops.Events (Level, EventType, Message, Source, MetaData, Timestamp)
-                VALUES ('ERROR', 'email_send', ?, 'email', ?, GETUTCDATE())
-                """,
-                (subject, metadata_fail),
-            )
-        except Exception:
-            pass
-
+        log_event('ERROR', 'email_send', subject, 'email', metadata_fail)
         return False
+
+
+async def send_email_async(subject: str, body: str, to_emails: List[str], html: bool = False) -> bool:
+    """send_email without blocking the event loop."""
+    return await asyncio.to_thread(send_email, subject, body, to_emails, html)
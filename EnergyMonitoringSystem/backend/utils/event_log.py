@@ -0,0 +1,82 @@
+"""
+Buffered writer for ops.Events rows logged from request handlers and helpers.
+Callers append to an in-memory buffer and return immediately; a background
+task writes the buffer with one executemany per flush, off the event loop.
+Without the task (CLI tools, worker process) rows are written synchronously.
+"""
+
+import asyncio
+import atexit
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Optional
+
+from backend.dal.database import db_helper
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 1.0
+MAX_BATCH = 200
+# Oldest rows are dropped beyond this rather than growing without bound during a DB outage
+MAX_BUFFERED = 10_000
+
+_INSERT_EVENT_SQL = """
+    INSERT INTO ops.Events (Level, EventType, Message, Source, MetaData, Timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+# deque append/popleft are thread-safe, so threads (e.g. to_thread'ed alert checks) can log too
+_BUFFER: deque = deque(maxlen=MAX_BUFFERED)
+_writer: Optional[asyncio.Task] = None
+
+
+def log_event(level: str, event_type: str, message: str, source: str, metadata: Optional[str] = None) -> None:
+    """Record an ops.Events row; never raises."""
+    row = (level, event_type, message, source, metadata, datetime.now(timezone.utc).replace(tzinfo=None))
+    if _writer is None or _writer.done():
+        try:
+            db_helper.execute_query(_INSERT_EVENT_SQL, row)
+        except Exception as e:
+            logger.warning("ops.Events insert failed: %s", e)
+        return
+    _BUFFER.append(row)
+
+
+def flush_events() -> None:
+    """Write everything buffered so far (blocking)."""
+    while _BUFFER:
+        rows = []
+        while _BUFFER and len(rows) < MAX_BATCH:
+            rows.append(_BUFFER.popleft())
+        try:
+            db_helper.execute_many(_INSERT_EVENT_SQL, rows)
+        except Exception as e:
+            logger.warning("Dropped %d ops.Events rows: %s", len(rows), e)
+
+
+async def _writer_loop() -> None:
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        if _BUFFER:
+            await asyncio.to_thread(flush_events)
+
+
+def start_event_writer() -> None:
+    """Start the background flush task on the running loop (idempotent)."""
+    global _writer
+    if _writer is None or _writer.done():
+        _writer = asyncio.get_running_loop().create_task(_writer_loop())
+
+
+async def stop_event_writer() -> None:
+    """Cancel the flush task and write what is left; later events are written synchronously."""
+    global _writer
+    if _writer is not None:
+        _writer.cancel()
+        await asyncio.gather(_writer, return_exceptions=True)
+        _writer = None
+    await asyncio.to_thread(flush_events)
+
+
+atexit.register(flush_events)
@@ -5,14 +5,51 @@ Handles async Modbus TCP connections with proper error handling and data decodin
 
 import asyncio
 import struct
-import math
 import json
+import logging
 import os
-from typing import Optional, Tuple, Any, Dict
-from pymodbus.client import ModbusTcpClient  # Use synchronous client
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional, Tuple, Any, Dict, Iterable, List
+from pymodbus.client import ModbusTcpClient  # Synchronous client; calls are run via asyncio.to_thread
 from pymodbus.exceptions import ModbusException, ConnectionException
-from pymodbus.payload import BinaryPayloadDecoder
-from pymodbus.constants import Endian
+
+logger = logging.getLogger(__name__)
+
+# Register words are repacked with these and reinterpreted as big-endian IEEE 754.
+# Candidate orders, most likely first: (byte order, word order) = (little, big) as on
+# Siemens PAC3220, then (big, big), (little, little), (big, little). Each candidate is
+# (packer, reverse word order).
+_WORDS2 = (struct.Struct("<2H"), struct.Struct(">2H"))
+_WORDS4 = (struct.Struct("<4H"), struct.Struct(">4H"))
+_ORDERS2 = ((_WORDS2[0], False), (_WORDS2[1], False), (_WORDS2[0], True), (_WORDS2[1], True))
+_ORDERS4 = ((_WORDS4[0], False), (_WORDS4[1], False), (_WORDS4[0], True), (_WORDS4[1], True))
+_F32 = struct.Struct(">f")
+_F64 = struct.Struct(">d")
+
+_REGISTER_MAP_PATH = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'register_map.json'))
+# Parsed register map shared by all clients: path -> (mtime_ns, register_map, parameter_types, plan, addresses)
+_REGISTER_MAP_CACHE: Dict[str, tuple] = {}
+
+
+@lru_cache(maxsize=None)
+def _block_struct(length: int) -> struct.Struct:
+    return struct.Struct(f"<{length}H")
+
+
+def _decode_ieee(registers: list, orders: tuple, out: struct.Struct, limit: float, first: int = 0) -> Tuple[Optional[float], int]:
+    """Return (value, index of the order that decoded it), trying orders[first] before the rest"""
+    n = len(orders)
+    try:
+        for i in range(first, first + n):
+            packer, reverse = orders[i % n]
+            val = out.unpack(packer.pack(*(registers[::-1] if reverse else registers)))[0]
+            # One chained comparison: false for NaN and +/-inf as well as out-of-range values
+            if -limit <= val <= limit:
+                return val, i % n
+    except struct.error:  # register value outside 0..0xFFFF
+        pass
+    return None, first
 
 
 class ModbusClient:
@@ -22,6 +59,13 @@ class ModbusClient:
     Loads register map from config/register_map.json for configuration-driven operation
     """
 
+    # One FC04 request may return at most 125 registers; gaps this small are read through
+    MAX_BLOCK_REGISTERS = 125
+    MAX_GAP_REGISTERS = 8
+    # Consecutive reads the documented (Siemens) order must fail before another order is tried first;
+    # a single glitchy read must not lock a parameter into a wrong order
+    ORDER_PROMOTE_AFTER = 5
+
     def __init__(self, host: str, port: int = 502, unit_id: int = 1, timeout: float = 10.0):
         self.host = host
         self.port = port
@@ -33,21 +77,36 @@ class ModbusClient:
         # Load register map from config file
         self._register_map = {}
         self._parameter_types = {}
+        self._addresses = MappingProxyType({})
+        # Block reads covering every input-register parameter, built once from the map
+        self._plan: List[Tuple[int, int, List[Tuple[str, int, int]]]] = []
         self._load_register_map()
+        # Per parameter on this device: index of the byte/word order tried first (0 = Siemens order),
+        # and how many reads in a row the Siemens order has failed
+        self._preferred_order: Dict[str, int] = {}
+        self._order_misses: Dict[str, int] = {}
 
     def _load_register_map(self):
-        """Load register map from config/register_map.json"""
-        config_path = os.path.join(os.path.dirname(__file__), '..', '..', 'config', 'register_map.json')
+        """Load register map from config/register_map.json (parsed once per file version, then shared)"""
+        config_path = _REGISTER_MAP_PATH
         try:
+            mtime_ns = os.stat(config_path).st_mtime_ns
+            cached = _REGISTER_MAP_CACHE.get(config_path)
+            if cached is not None and cached[0] == mtime_ns:
+                self._register_map, self._parameter_types, self._plan, self._addresses = cached[1:]
+                return
+
             with open(config_path, 'r') as f:
                 config = json.load(f)
 
+            register_map = {}
+            parameter_types = {}
             for param_name, param_config in config.items():
                 param_type = param_config.get('type')
                 address = param_config.get('address')
                 scale = param_config.get('scale', 1.0)
 
-                self._register_map[param_name] = {
+                register_map[param_name] = {
                     'address': address,
                     'type': param_type,
                     'scale': scale
@@ -56,28 +115,35 @@ class ModbusClient:
                 # Determine parameter type based on register type
                 # input_register typically uses float32, but can be configured
                 if param_type == 'input_register':
-                    # For energy values, use double (64-bit), for others use float (32-bit)
-                    if 'energy' in param_name.lower() or 'kwh' in param_name.lower():
-                        self._parameter_types[param_name] = False  # double
-                    else:
-                        self._parameter_types[param_name] = True   # float
+                    # "width" in the config wins; otherwise energy values are double (64-bit), others float (32-bit)
+                    width = param_config.get('width')
+                    if width not in ('f32', 'f64'):
+                        lname = param_name.lower()
+                        width = 'f64' if ('energy' in lname or 'kwh' in lname) else 'f32'
+                    register_map[param_name]['width'] = width
+                    parameter_types[param_name] = width == 'f32'
                 elif param_type == 'coil':
-                    self._parameter_types[param_name] = 'coil'
+                    parameter_types[param_name] = 'coil'
 
-            print(f"[INFO] Loaded register map with {len(self._register_map)} parameters from {config_path}")
+            # Shared between instances, so exposed read-only
+            self._register_map = MappingProxyType(register_map)
+            self._parameter_types = MappingProxyType(parameter_types)
+            self._plan = self._build_plan(register_map)
+            self._addresses = MappingProxyType({k: v['address'] for k, v in register_map.items()})
+            _REGISTER_MAP_CACHE[config_path] = (mtime_ns, self._register_map, self._parameter_types, self._plan, self._addresses)
+            logger.info("Loaded register map with %d parameters from %s", len(register_map), config_path)
 
         except FileNotFoundError:
-            print(f"[ERROR] Register map config file not found: {config_path}")
-            print("[ERROR] Using empty register map - configuration required")
+            logger.error("Register map config file not found: %s - using empty register map, configuration required", config_path)
         except json.JSONDecodeError as e:
-            print(f"[ERROR] Invalid JSON in register map config: {e}")
+            logger.error("Invalid JSON in register map config: %s", e)
         except Exception as e:
-            print(f"[ERROR] Failed to load register map: {e}")
+            logger.error("Failed to load register map: %s", e)
 
     @property
     def REGISTER_MAP(self):
-        """Legacy property for backward compatibility - returns address mapping only"""
-        return {k: v['address'] for k, v in self._register_map.items()}
+        """Legacy property for backward compatibility - returns address mapping only (read-only)"""
+        return self._addresses
 
     @property
     def PARAMETER_TYPES(self):
@@ -93,27 +159,27 @@ class ModbusClient:
                 timeout=self.timeout,
             )
 
-            self.connected = self.client.connect()
+            self.connected = await asyncio.to_thread(self.client.connect)
             if self.connected:
-                print(f"[INFO] Connected to PAC3220 at {self.host}:{self.port} (Unit ID: {self.unit_id})")
+                logger.info("Connected to PAC3220 at %s:%s (Unit ID: %s)", self.host, self.port, self.unit_id)
             else:
-                print(f"[ERROR] Failed to connect to PAC3220 at {self.host}:{self.port} (Unit ID: {self.unit_id})")
+                logger.error("Failed to connect to PAC3220 at %s:%s (Unit ID: %s)", self.host, self.port, self.unit_id)
 
             return self.connected
 
         except Exception as e:
-            print(f"[ERROR] Modbus connection error: {str(e).encode('ascii', 'ignore').decode('ascii')}")
+            logger.error("Modbus connection error: %s", e)
             return False
 
     async def disconnect(self):
         """Close Modbus connection"""
         try:
             if self.client:
-                self.client.close()
+                await asyncio.to_thread(self.client.close)
             self.connected = False
-            print(f" Disconnected from {self.host}")
+            logger.debug("Disconnected from %s", self.host)
         except Exception as e:
-            print(f" Disconnect error: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.warning("Disconnect error: %s", e)
             self.connected = False
 
     async def _read_registers(self, address: int, count: int) -> Optional[list]:
@@ -128,12 +194,13 @@ class ModbusClient:
             List of register values or None if error
         """
         if not self.client or not self.connected:
-            print(" Not connected to Modbus device".encode('ascii', 'replace').decode('ascii'))
+            logger.error("Not connected to Modbus device %s", self.host)
             return None
 
         try:
-            # Use synchronous read with input registers
-            response = self.client.read_input_registers(
+            # Synchronous client: run the request in a worker thread so the event loop stays free
+            response = await asyncio.to_thread(
+                self.client.read_input_registers,
                 address=address,
                 count=count,
                 slave=self.unit_id
@@ -141,18 +208,18 @@ class ModbusClient:
             if response and not response.isError():
                 return response.registers
 
-            print(f"[ERROR] Register read failed at {address}".encode('ascii', 'replace').decode('ascii'))
+            logger.error("Register read failed at %s", address)
             return None
 
         except (ModbusException, ConnectionException, Exception) as e:
-            print(f"[ERROR] Modbus read error at address {address}: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.error("Modbus read error at address %s: %s", address, e)
             # Attempt a lightweight reconnect once
             try:
                 if self.client:
-                    self.client.close()
-                self.connected = self.client.connect()
+                    await asyncio.to_thread(self.client.close)
+                self.connected = await asyncio.to_thread(self.client.connect)
             except Exception as ex:
-                print(f"[ERROR] Reconnect failed: {str(ex).encode('ascii', 'replace').decode('ascii')}")
+                logger.error("Reconnect failed: %s", ex)
             return None
 
     @staticmethod
@@ -172,27 +239,10 @@ class ModbusClient:
             return None
 
         # Reject obvious invalid pattern
-        if registers == [0xFFFF, 0xFFFF]:
+        if registers[0] == 0xFFFF and registers[1] == 0xFFFF:
             return None
-        orders = [
-            (Endian.Little, Endian.Big),   # common Siemens
-            (Endian.Big, Endian.Big),
-            (Endian.Little, Endian.Little),
-            (Endian.Big, Endian.Little),
-        ]
-        for b, w in orders:
-            try:
-                decoder = BinaryPayloadDecoder.fromRegisters(registers, byteorder=b, wordorder=w)
-                val = decoder.decode_32bit_float()
-                if val is None or math.isnan(val) or math.isinf(val):
-                    continue
-                # Guard against absurd values
-                if abs(val) > 1e9:
-                    continue
-                return val
-            except Exception:
-                continue
-        return None
+        # Guard against absurd values
+        return _decode_ieee(registers, _ORDERS2, _F32, 1e9)[0]
 
     @staticmethod
     def decode_double(registers: list, byte_order: str = ">", word_order: str = "BADC") -> Optional[float]:
@@ -210,24 +260,8 @@ class ModbusClient:
         if not registers or len(registers) != 4:
             return None
 
-        orders = [
-            (Endian.Little, Endian.Big),   # common Siemens
-            (Endian.Big, Endian.Big),
-            (Endian.Little, Endian.Little),
-            (Endian.Big, Endian.Little),
-        ]
-        for b, w in orders:
-            try:
-                decoder = BinaryPayloadDecoder.fromRegisters(registers, byteorder=b, wordorder=w)
-                val = decoder.decode_64bit_float()
-                if val is None or math.isnan(val) or math.isinf(val):
-                    continue
-                if abs(val) > 1e15:  # above documented overflow
-                    continue
-                return val
-            except Exception:
-                continue
-        return None
+        # 1e15: above documented overflow
+        return _decode_ieee(registers, _ORDERS4, _F64, 1e15)[0]
 
     async def read_float(self, address: int, byte_order: str = ">", word_order: str = "BADC") -> Tuple[Optional[float], Optional[list]]:
         """
@@ -278,7 +312,7 @@ class ModbusClient:
             Tuple of (scaled_value, raw_registers) or (None, None) on error
         """
         if param_name not in self._register_map:
-            print(f"[ERROR] Unknown parameter: {param_name}")
+            logger.error("Unknown parameter: %s", param_name)
             return None, None
 
         param_config = self._register_map[param_name]
@@ -288,12 +322,11 @@ class ModbusClient:
 
         try:
             if param_type == 'input_register':
-                # Determine if float32 or float64 based on parameter type
-                is_float32 = self._parameter_types.get(param_name, True)
-                if is_float32:
-                    value, registers = await self.read_float(address)
-                else:
-                    value, registers = await self.read_double(address)
+                count = 2 if param_config['width'] == 'f32' else 4
+                registers = await self._read_registers(address, count)
+                if registers is None:
+                    return None, None
+                value = self._decode_param(param_name, registers, count)
 
                 # Apply scaling
                 if value is not None:
@@ -303,22 +336,147 @@ class ModbusClient:
                 # Read coil state using Modbus coils function
                 if not self.client or not self.connected:
                     return None, None
-                resp = self.client.read_coils(address, 1, slave=self.unit_id)
+                resp = await asyncio.to_thread(self.client.read_coils, address, 1, slave=self.unit_id)
                 if resp and not resp.isError():
                     value = bool(resp.bits[0])
                     registers = [int(resp.bits[0])]
                 else:
                     value = None
             else:
-                print(f"[ERROR] Unsupported parameter type: {param_type}")
+                logger.error("Unsupported parameter type: %s", param_type)
                 return None, None
 
             return value, registers
 
         except Exception as e:
-            print(f"[ERROR] Error reading parameter {param_name}: {e}")
+            logger.error("Error reading parameter %s: %s", param_name, e)
             return None, None
 
+    def _build_plan(self, param_names: Iterable[str]) -> List[Tuple[int, int, List[Tuple[str, int, int]]]]:
+        """
+        Group input-register parameters into block reads
+
+        Parameters whose addresses lie within MAX_GAP_REGISTERS of each other share one
+        FC04 request of at most MAX_BLOCK_REGISTERS registers.
+
+        Returns:
+            List of (base_address, length, [(name, offset, count), ...])
+        """
+        planned = []
+        for name in param_names:
+            cfg = self._register_map.get(name)
+            if cfg is not None and cfg['type'] == 'input_register':
+                count = 2 if cfg['width'] == 'f32' else 4
+                planned.append((cfg['address'], count, name))
+        planned.sort()
+
+        plan = []
+        for address, count, name in planned:
+            if plan:
+                base, length, members = plan[-1]
+                end = base + length
+                if address - end <= self.MAX_GAP_REGISTERS and max(end, address + count) - base <= self.MAX_BLOCK_REGISTERS:
+                    members.append((name, address - base, count))
+                    plan[-1] = (base, max(end, address + count) - base, members)
+                    continue
+            plan.append((address, count, [(name, 0, count)]))
+        return plan
+
+    def _decode_param(self, name: str, raw: list, count: int) -> Optional[float]:
+        """
+        Decode one parameter's registers, starting with its preferred order. The preference only
+        moves off the Siemens order after ORDER_PROMOTE_AFTER consecutive reads it failed to decode.
+        """
+        if len(raw) != count:
+            return None
+        if count == 2:
+            # Reject obvious invalid pattern
+            if raw[0] == 0xFFFF and raw[1] == 0xFFFF:
+                return None
+            value, order = _decode_ieee(raw, _ORDERS2, _F32, 1e9, self._preferred_order.get(name, 0))
+        else:
+            value, order = _decode_ieee(raw, _ORDERS4, _F64, 1e15, self._preferred_order.get(name, 0))
+        if value is None:
+            return None
+        preferred = self._preferred_order.get(name, 0)
+        if order == 0:
+            self._preferred_order.pop(name, None)
+            self._order_misses.pop(name, None)
+        elif order != preferred:
+            misses = self._order_misses.get(name, 0) + 1
+            if misses >= self.ORDER_PROMOTE_AFTER:
+                self._preferred_order[name] = order
+                misses = 0
+            self._order_misses[name] = misses
+        return value
+
+    def _decode_block(self, registers: list, members: List[Tuple[str, int, int]], results: Dict[str, Tuple[Optional[float], Optional[list]]]) -> None:
+        """Decode every parameter of one block read from a single byte buffer"""
+        try:
+            # Repacked once in the Siemens order; each value is then read in place
+            buf = _block_struct(len(registers)).pack(*registers)
+        except struct.error:
+            buf = None
+        for name, offset, count in members:
+            raw = registers[offset:offset + count]
+            value = None
+            if buf is not None and not self._preferred_order.get(name):
+                value = (_F32 if count == 2 else _F64).unpack_from(buf, offset * 2)[0]
+                limit = 1e9 if count == 2 else 1e15
+                if not -limit <= value <= limit:
+                    value = None
+            if value is None:
+                # Preferred/other byte-word orders and the invalid-pattern checks
+                value = self._decode_param(name, raw, count)
+            if value is not None:
+                value *= self._register_map[name].get('scale', 1.0)
+            results[name] = (value, raw)
+
+    async def _read_plan(self, plan, results: Dict[str, Tuple[Optional[float], Optional[list]]]) -> None:
+        for base, length, members in plan:
+            registers = await self._read_registers(base, length) if len(members) > 1 else None
+            if registers is not None and len(registers) == length:
+                self._decode_block(registers, members, results)
+                continue
+            # Single parameter, or the block read failed: read each on its own
+            for name, _, _ in members:
+                results[name] = await self.read_parameter(name)
+
+    async def read_all(self) -> Dict[str, Tuple[Optional[float], Optional[list]]]:
+        """
+        Read every parameter in the register map using the precomputed block plan
+
+        Returns:
+            Dict of name -> (scaled_value, raw_registers), as read_parameter returns
+        """
+        results: Dict[str, Tuple[Optional[float], Optional[list]]] = {}
+        await self._read_plan(self._plan, results)
+        for name, cfg in self._register_map.items():
+            if cfg['type'] != 'input_register':
+                results[name] = await self.read_parameter(name)
+        return results
+
+    async def read_parameters_batch(self, param_names: Iterable[str]) -> Dict[str, Tuple[Optional[float], Optional[list]]]:
+        """
+        Read several parameters with as few requests as possible
+
+        Input-register parameters are fetched in block reads (see _build_plan); other
+        parameter types are read individually.
+
+        Args:
+            param_names: Parameter names as defined in register_map.json
+
+        Returns:
+            Dict of name -> (scaled_value, raw_registers), as read_parameter returns
+        """
+        names = list(dict.fromkeys(param_names))
+        results: Dict[str, Tuple[Optional[float], Optional[list]]] = {}
+        await self._read_plan(self._build_plan(names), results)
+        for name in names:
+            if name not in results:
+                results[name] = await self.read_parameter(name)
+        return results
+
     async def write_coil(self, address: int, value: bool) -> bool:
         """
         Write to a coil (digital output)
@@ -331,32 +489,33 @@ class ModbusClient:
             True if successful, False otherwise
         """
         if not self.client or not self.connected:
-            print("[ERROR] Not connected to Modbus device".encode('ascii', 'replace').decode('ascii'))
+            logger.error("Not connected to Modbus device %s", self.host)
             return False
 
         try:
-            response = self.client.write_coil(
+            response = await asyncio.to_thread(
+                self.client.write_coil,
                 address=address,
                 value=value,
                 slave=self.unit_id
             )
 
             if response and not response.isError():
-                print(f"✅ Coil {address} set to {value}")
+                logger.debug("Coil %s set to %s", address, value)
                 return True
             else:
-                print(f"[ERROR] Failed to write coil {address}".encode('ascii', 'replace').decode('ascii'))
+                logger.error("Failed to write coil %s", address)
                 return False
 
         except (ModbusException, ConnectionException, Exception) as e:
-            print(f"[ERROR] Coil write error at {address}: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.error("Coil write error at %s: %s", address, e)
             return False
 
     async def read_coil_state(self, address: int) -> Optional[bool]:
         if not self.client or not self.connected:
             return None
         try:
-            resp = self.client.read_coils(address, 1, slave=self.unit_id)
+            resp = await asyncio.to_thread(self.client.read_coils, address, 1, slave=self.unit_id)
             if resp and not resp.isError():
                 return bool(resp.bits[0])
             return None
@@ -372,22 +531,23 @@ class ModbusClient:
             value: Integer value to write (0/1 for DO)
         """
         if not self.client or not self.connected:
-            print("[ERROR] Not connected to Modbus device".encode('ascii', 'replace').decode('ascii'))
+            logger.error("Not connected to Modbus device %s", self.host)
             return False
         try:
-            response = self.client.write_register(
+            response = await asyncio.to_thread(
+                self.client.write_register,
                 address=address,
                 value=int(value),
                 slave=self.unit_id,
             )
             if response and not response.isError():
-                print(f"✅ Register {address} set to {value}")
+                logger.debug("Register %s set to %s", address, value)
                 return True
             else:
-                print(f"[ERROR] Failed to write register {address}".encode('ascii', 'replace').decode('ascii'))
+                logger.error("Failed to write register %s", address)
             return False
         except (ModbusException, ConnectionException, Exception) as e:
-            print(f"[ERROR] Register write error at {address}: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.error("Register write error at %s: %s", address, e)
             return False
 
     async def read_register_value(self, address: int) -> Optional[int]:
@@ -401,14 +561,14 @@ class ModbusClient:
             Integer register value or None on error
         """
         if not self.client or not self.connected:
-            print("[ERROR] Not connected to Modbus device".encode('ascii', 'replace').decode('ascii'))
+            logger.error("Not connected to Modbus device %s", self.host)
             return None
         try:
-            resp = self.client.read_holding_registers(address=address, count=1, slave=self.unit_id)
+            resp = await asyncio.to_thread(self.client.read_holding_registers, address=address, count=1, slave=self.unit_id)
             if resp and not resp.isError() and hasattr(resp, 'registers'):
                 return int(resp.registers[0])
-            print(f"[ERROR] Failed to read holding register {address}".encode('ascii', 'replace').decode('ascii'))
+            logger.error("Failed to read holding register %s", address)
             return None
         except (ModbusException, ConnectionException, Exception) as e:
-            print(f"[ERROR] Holding register read error at {address}: {str(e).encode('ascii', 'replace').decode('ascii')}")
+            logger.error("Holding register read error at %s: %s", address, e)
             return None
@@ -1,21 +1,102 @@
-from typing import Optional
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
 from pymodbus.client import ModbusTcpClient
+from pymodbus.exceptions import ModbusIOException
 
 REG_DO_COMMAND = 60008
 REG_DO_STATUS_BIT = 400
 REG_DO_TYPE = 50035
 
+# Connected clients kept per (host, port); the unit id travels with each request
+_CLIENTS: "OrderedDict[Tuple[str, int], _PooledClient]" = OrderedDict()
+# Least recently used idle clients are closed beyond this many
+MAX_POOLED_CLIENTS = 256
+_CLIENTS_LOCK = threading.Lock()
+
+
+class DeviceUnreachable(ConnectionError):
+    """No TCP connection to the device (refused, unreachable or timed out); retrying at once will not help."""
+
+
+class _PooledClient:
+    def __init__(self, host: str, port: int):
+        self.client = ModbusTcpClient(host, port=port)
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+@contextmanager
+def pooled_client(host: str, port: int = 502) -> Iterator[Optional[ModbusTcpClient]]:
+    """
+    Yield a connected client for host:port, reusing the socket across calls.
+    Yields None when the device cannot be reached. A client that raises is closed
+    so the next call reconnects.
+    """
+    key = (host, int(port))
+    with _CLIENTS_LOCK:
+        entry = _CLIENTS.get(key)
+        if entry is None:
+            entry = _CLIENTS[key] = _PooledClient(host, int(port))
+            _evict_lru()
+        else:
+            _CLIENTS.move_to_end(key)
+    with entry.lock:
+        try:
+            if not entry.client.connected and not entry.client.connect():
+                yield None
+                return
+            yield entry.client
+        except Exception:
+            entry.client.close()
+            raise
+        finally:
+            entry.last_used = time.monotonic()
+
+
+def _evict_lru() -> None:
+    # Caller holds _CLIENTS_LOCK; clients in use are skipped
+    excess = len(_CLIENTS) - MAX_POOLED_CLIENTS
+    if excess <= 0:
+        return
+    for key in [k for k, e in _CLIENTS.items() if not e.lock.locked()][:excess]:
+        _CLIENTS.pop(key).client.close()
+
+
+def drop_on_io_error(client: ModbusTcpClient, resp) -> None:
+    """Close a pooled client whose request got no valid answer (timeout, reset) so the next call reconnects."""
+    if isinstance(resp, ModbusIOException):
+        client.close()
+
+
+def close_idle_clients(max_idle_seconds: float = 60.0) -> None:
+    """Close and forget pooled clients unused for longer than max_idle_seconds."""
+    cutoff = time.monotonic() - max_idle_seconds
+    with _CLIENTS_LOCK:
+        stale = [k for k, e in _CLIENTS.items() if e.last_used < cutoff and not e.lock.locked()]
+        for key in stale:
+            _CLIENTS.pop(key).client.close()
+
+
+def close_all_clients() -> None:
+    """Close every pooled client (process shutdown)."""
+    with _CLIENTS_LOCK:
+        while _CLIENTS:
+            _, entry = _CLIENTS.popitem()
+            entry.client.close()
+
 def encode_do_value(output_id: int, action: int) -> int:
     return ((int(output_id) & 0xFF) << 8) | (int(action) & 0xFF)
 
 def read_do_type(host: str, port: int = 502, unit_id: int = 1, reg_do_type: int = REG_DO_TYPE) -> Optional[int]:
-    client = ModbusTcpClient(host, port=port)
-    if not client.connect():
-        return None
-    try:
+    with pooled_client(host, port) as client:
+        if client is None:
+            return None
         resp = client.read_holding_registers(reg_do_type, 2, slave=unit_id)
-    finally:
-        client.close()
+        drop_on_io_error(client, resp)
     if not resp or resp.isError() or not getattr(resp, "registers", None):
         return None
     hi = int(resp.registers[0])
@@ -23,31 +104,47 @@ def read_do_type(host: str, port: int = 502, unit_id: int = 1, reg_do_type: int
     return (hi << 16) | lo
 
 def write_do(host: str, output_id: int, action: int, port: int = 502, unit_id: int = 1, reg_do_command: int = REG_DO_COMMAND, check_type: bool = False, reg_do_type: int = REG_DO_TYPE) -> bool:
+    """
+    Write the DO command register. False when the device answered with an error;
+    raises DeviceUnreachable when no connection could be made (pymodbus' connect()
+    swallows the socket error, so it is reported here instead).
+    """
     if check_type:
         t = read_do_type(host, port, unit_id, reg_do_type)
         if t != 2:
             return False
     value = encode_do_value(output_id, action)
-    client = ModbusTcpClient(host, port=port)
-    if not client.connect():
-        return False
-    try:
+    with pooled_client(host, port) as client:
+        if client is None:
+            raise DeviceUnreachable(f"cannot connect to {host}:{port}")
         resp = client.write_register(reg_do_command, value, slave=unit_id)
-    finally:
-        client.close()
+        drop_on_io_error(client, resp)
     return bool(resp and not resp.isError())
 
 def write_do_0(host: str, action: int, port: int = 502, unit_id: int = 1, reg_do_command: int = REG_DO_COMMAND, check_type: bool = False, reg_do_type: int = REG_DO_TYPE, output_id: int = 0) -> bool:
     return write_do(host, output_id, action, port, unit_id, reg_do_command, check_type, reg_do_type)
 
 def read_do_0(host: str, port: int = 502, unit_id: int = 1, reg_do_status_bit: int = REG_DO_STATUS_BIT) -> Optional[int]:
-    client = ModbusTcpClient(host, port=port)
-    if not client.connect():
-        return None
-    try:
+    with pooled_client(host, port) as client:
+        if client is None:
+            return None
         resp = client.read_discrete_inputs(reg_do_status_bit, 1, slave=unit_id)
-    finally:
-        client.close()
+        drop_on_io_error(client, resp)
     if not resp or resp.isError() or not getattr(resp, "bits", None):
         return None
     return 1 if bool(resp.bits[0]) else 0
+
+
+# Async variants: the pooled sync client runs in a worker thread, so callers can
+# asyncio.gather() across analyzers (each host has its own pooled connection).
+async def read_do_type_async(host: str, port: int = 502, unit_id: int = 1, reg_do_type: int = REG_DO_TYPE) -> Optional[int]:
+    return await asyncio.to_thread(read_do_type, host, port, unit_id, reg_do_type)
+
+async def write_do_async(host: str, output_id: int, action: int, port: int = 502, unit_id: int = 1, reg_do_command: int = REG_DO_COMMAND, check_type: bool = False, reg_do_type: int = REG_DO_TYPE) -> bool:
+    return await asyncio.to_thread(write_do, host, output_id, action, port, unit_id, reg_do_command, check_type, reg_do_type)
+
+async def write_do_0_async(host: str, action: int, port: int = 502, unit_id: int = 1, reg_do_command: int = REG_DO_COMMAND, check_type: bool = False, reg_do_type: int = REG_DO_TYPE, output_id: int = 0) -> bool:
+    return await write_do_async(host, output_id, action, port, unit_id, reg_do_command, check_type, reg_do_type)
+
+async def read_do_0_async(host: str, port: int = 502, unit_id: int = 1, reg_do_status_bit: int = REG_DO_STATUS_BIT) -> Optional[int]:
+    return await asyncio.to_thread(read_do_0, host, port, unit_id, reg_do_status_bit)
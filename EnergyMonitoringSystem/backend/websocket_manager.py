@@ -4,14 +4,53 @@ Provides live data streaming for charts and status indicators.
 """
 
 import asyncio
-from typing import Dict, Set, Any
+import logging
+import os
+import time
+from typing import Dict, Set, Any, Optional, Iterable
 from fastapi import WebSocket, WebSocketDisconnect
+from starlette.websockets import WebSocketState
 from datetime import datetime
 
+import orjson
+
 from backend.dal.database import db_helper
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # optional: without it broadcasts reach only this process's clients
+    aioredis = None
+
+logger = logging.getLogger(__name__)
+
+# Per-client outbound backlog; a client this far behind loses its oldest messages
+SEND_QUEUE_SIZE = 100
+# Redis pub/sub channel carrying broadcasts between API workers
+PUBSUB_CHANNEL = "ems:ws"
+# Status counts are reused for this long by every caller
+STATUS_COUNTS_TTL_SECONDS = 5
+
+_STATUS_COUNTS_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM app.Analyzers WHERE IsActive = 1) AS active_devices,
+        (SELECT COUNT(*) FROM app.Users WHERE IsActive = 1) AS total_users,
+        -- Row count from partition metadata instead of scanning app.Readings
+        (SELECT SUM(p.rows) FROM sys.partitions p
+         WHERE p.object_id = OBJECT_ID('app.Readings') AND p.index_id IN (0, 1)) AS total_readings
+"""
+_status_counts: Optional[Dict[str, int]] = None
+_status_counts_at = 0.0
+
+
 class WebSocketManager:
-    """Manages WebSocket connections for real-time updates"""
+    """Manages WebSocket connections for real-time updates
+
+    Each connection gets an outbound queue drained by its own sender task, so a
+    broadcast serializes the message once and never waits on a slow client.
+
+    After start_pubsub() broadcasts are published to Redis and every worker
+    (this one included) delivers them to its own connections.
+    """
 
     def __init__(self):
         self.active_connections: Dict[str, Set[WebSocket]] = {
@@ -19,11 +58,19 @@ class WebSocketManager:
             "dashboard": set(),
             "readings": set()
         }
-        self.user_connections: Dict[int, WebSocket] = {}
+        # A user may have several tabs open
+        self.user_connections: Dict[int, Set[WebSocket]] = {}
+        self._queues: Dict[WebSocket, asyncio.Queue] = {}
+        self._senders: Dict[WebSocket, asyncio.Task] = {}
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
 
     async def connect(self, websocket: WebSocket, channel: str = "dashboard", user_id: int = None):
         """Connect a WebSocket client"""
         await websocket.accept()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._queues[websocket] = queue
+        self._senders[websocket] = asyncio.create_task(self._sender(websocket, queue))
 
         # Add to channel connections
         if channel not in self.active_connections:
@@ -32,74 +79,202 @@ class WebSocketManager:
 
         # Add to user connections if user_id provided
         if user_id:
-            self.user_connections[user_id] = websocket
+            self.user_connections.setdefault(user_id, set()).add(websocket)
 
         print(f"WebSocket connected: channel={channel}, user_id={user_id}")
 
     def disconnect(self, websocket: WebSocket, channel: str = "dashboard", user_id: int = None):
         """Disconnect a WebSocket client"""
+        self._queues.pop(websocket, None)
+        sender = self._senders.pop(websocket, None)
+        if sender is not None:
+            sender.cancel()
 
         # Remove from channel connections
         if channel in self.active_connections:
             self.active_connections[channel].discard(websocket)
 
         # Remove from user connections
-        if user_id and user_id in self.user_connections:
-            if self.user_connections[user_id] == websocket:
-                del self.user_connections[user_id]
+        if user_id:
+            self._discard_user(user_id, websocket)
 
         print(f"WebSocket disconnected: channel={channel}, user_id={user_id}")
 
-    async def broadcast_to_channel(self, channel: str, message: Dict[str, Any]):
-        """Broadcast message to all connections in a channel"""
-        if channel not in self.active_connections:
+    def _discard_user(self, user_id: int, websocket: WebSocket) -> None:
+        conns = self.user_connections.get(user_id)
+        if conns is not None:
+            conns.discard(websocket)
+            if not conns:
+                del self.user_connections[user_id]
+
+    async def wait_closed(self, websocket: WebSocket):
+        """Hold a server-push connection open until the client closes it (client messages are ignored)"""
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    async def _sender(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                await websocket.send_text(await queue.get())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Connection is dead: stop routing messages to it
+            self._queues.pop(websocket, None)
+            self._senders.pop(websocket, None)
+            for conns in self.active_connections.values():
+                conns.discard(websocket)
+
+    def _enqueue(self, websocket: WebSocket, text: str) -> bool:
+        queue = self._queues.get(websocket)
+        if queue is None:
+            return False
+        if websocket.client_state != WebSocketState.CONNECTED:
+            # Closed by the client but not yet disconnected by its endpoint: stop queueing to it
+            self._queues.pop(websocket, None)
+            sender = self._senders.pop(websocket, None)
+            if sender is not None:
+                sender.cancel()
+            return False
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(text)
+        return True
+
+    @staticmethod
+    def _encode(message_data: Dict[str, Any]) -> str:
+        # Compact UTF-8 JSON like WebSocket.send_json, via the C encoder the API responses use
+        return orjson.dumps(message_data, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    async def start_pubsub(self, redis_url: str) -> bool:
+        """Route broadcasts through Redis so all workers share them; False if unavailable"""
+        if aioredis is None:
+            logger.warning("REDIS_URL set but redis is not installed; WebSocket broadcasts stay per-process")
+            return False
+        self._redis = aioredis.from_url(redis_url)
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(PUBSUB_CHANNEL)
+        except Exception as e:
+            logger.warning("Redis pub/sub unavailable, WebSocket broadcasts stay per-process: %s", e)
+            self._redis = None
+            return False
+        self._listener = asyncio.create_task(self._listen(pubsub))
+        return True
+
+    async def stop_pubsub(self) -> None:
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def _listen(self, pubsub):
+        try:
+            async for msg in pubsub.listen():
+                # Envelope: "<target>\n<json>", target is "channel:<name>" or "user:<id>"
+                target, _, text = msg["data"].decode().partition("\n")
+                kind, _, name = target.partition(":")
+                if kind == "channel":
+                    self._deliver_channel(name, text)
+                elif kind == "user":
+                    self._deliver_user(int(name), text)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("WebSocket pub/sub listener stopped, falling back to local delivery: %s", e)
+        finally:
+            self._listener = None
+            await pubsub.aclose()
+
+    async def _publish(self, target: str, text: str) -> bool:
+        if self._listener is None:
+            return False
+        try:
+            await self._redis.publish(PUBSUB_CHANNEL, f"{target}\n{text}")
+            return True
+        except Exception as e:
+            logger.warning("WebSocket publish failed, delivering locally: %s", e)
+            return False
+
+    async def claim_periodic(self, name: str, ttl_seconds: int) -> bool:
+        """With pub/sub, let only one worker per interval run a periodic broadcast"""
+        if self._listener is None:
+            return True
+        try:
+            return bool(await self._redis.set(f"{PUBSUB_CHANNEL}:lock:{name}", os.getpid(), nx=True, ex=ttl_seconds))
+        except Exception:
+            return True
+
+    def _deliver_channel(self, channel: str, text: str) -> None:
+        conns = self.active_connections.get(channel)
+        if not conns:
+            return
+        disconnected = [c for c in conns if not self._enqueue(c, text)]
+
+        # Clean up connections without a live sender
+        for conn in disconnected:
+            conns.discard(conn)
+
+    def _deliver_user(self, user_id: int, text: str) -> None:
+        conns = self.user_connections.get(user_id)
+        if not conns:
             return
+        for conn in [c for c in conns if not self._enqueue(c, text)]:
+            # Connection is dead, remove it
+            self._discard_user(user_id, conn)
 
+    async def _broadcast(self, channel: str, message: Dict[str, Any], timestamp: str):
         # Prepare message
         message_data = {
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": timestamp,
             "channel": channel,
             **message
         }
 
-        # Send to all connections in channel
-        disconnected = set()
-        for connection in self.active_connections[channel]:
-            try:
-                await connection.send_json(message_data)
-            except Exception:
-                disconnected.add(connection)
+        # Serialize once, queue for every connection in the channel (in every worker with pub/sub)
+        text = self._encode(message_data)
+        if not await self._publish(f"channel:{channel}", text):
+            self._deliver_channel(channel, text)
 
-        # Clean up disconnected connections
-        for conn in disconnected:
-            self.active_connections[channel].discard(conn)
+    async def broadcast_to_channel(self, channel: str, message: Dict[str, Any], timestamp: Optional[str] = None):
+        """Broadcast message to all connections in a channel"""
+        if channel not in self.active_connections:
+            return
+        await self._broadcast(channel, message, timestamp or datetime.utcnow().isoformat())
+
+    async def broadcast_to_channels(self, channels: Iterable[str], message: Dict[str, Any]):
+        """Broadcast one message to several channels with one timestamp; Redis publishes run concurrently"""
+        timestamp = datetime.utcnow().isoformat()
+        await asyncio.gather(*(
+            self._broadcast(channel, message, timestamp) for channel in channels if channel in self.active_connections
+        ))
 
-    async def send_to_user(self, user_id: int, message: Dict[str, Any]):
+    async def send_to_user(self, user_id: int, message: Dict[str, Any], timestamp: Optional[str] = None):
         """Send message to specific user"""
-        if user_id in self.user_connections:
-            try:
-                message_data = {
-                    "timestamp": datetime.utcnow().isoformat(),
-                    "user_id": user_id,
-                    **message
-                }
-                await self.user_connections[user_id].send_json(message_data)
-            except Exception:
-                # Connection is dead, remove it
-                del self.user_connections[user_id]
+        # With pub/sub the user may be connected to another worker
+        if self._listener is None and user_id not in self.user_connections:
+            return
+        message_data = {
+            "timestamp": timestamp or datetime.utcnow().isoformat(),
+            "user_id": user_id,
+            **message
+        }
+        text = self._encode(message_data)
+        if not await self._publish(f"user:{user_id}", text):
+            self._deliver_user(user_id, text)
 
     async def broadcast_device_update(self, analyzer_id: int, readings: Dict[str, Any]):
         """Broadcast device reading updates"""
         message = {
             "type": "device_update",
             "analyzer_id": analyzer_id,
-            "readings": readings,
-            "timestamp": asyncio.get_event_loop().time()
+            "readings": readings
         }
 
-        await self.broadcast_to_channel("readings", message)
-        await self.broadcast_to_channel("dashboard", message)
-        await self.broadcast_to_channel("admin", message)
+        await self.broadcast_to_channels(("readings", "dashboard", "admin"), message)
 
     async def broadcast_system_status(self, status_data: Dict[str, Any]):
         """Broadcast system status updates"""
@@ -108,8 +283,7 @@ class WebSocketManager:
             "data": status_data
         }
 
-        await self.broadcast_to_channel("admin", message)
-        await self.broadcast_to_channel("dashboard", message)
+        await self.broadcast_to_channels(("admin", "dashboard"), message)
 
     async def broadcast_alert(self, user_id: int, alert_data: Dict[str, Any]):
         """Broadcast alert to specific user"""
@@ -118,27 +292,39 @@ class WebSocketManager:
             "alert": alert_data
         }
 
-        await self.send_to_user(user_id, message)
-        # Also broadcast to admin channel
-        await self.broadcast_to_channel("admin", message)
+        # Also broadcast to admin channel, stamped with the same time
+        timestamp = datetime.utcnow().isoformat()
+        await asyncio.gather(
+            self.send_to_user(user_id, message, timestamp),
+            self.broadcast_to_channel("admin", message, timestamp),
+        )
 
 # Global WebSocket manager instance
 ws_manager = WebSocketManager()
 
+def get_status_counts() -> Dict[str, int]:
+    """Active devices, active users and (approximate) readings, cached for STATUS_COUNTS_TTL_SECONDS (blocking)"""
+    global _status_counts, _status_counts_at
+    now = time.monotonic()
+    if _status_counts is None or now - _status_counts_at >= STATUS_COUNTS_TTL_SECONDS:
+        rows = db_helper.execute_query(_STATUS_COUNTS_SQL)
+        row = rows[0] if rows else {}
+        _status_counts = {k: int(row.get(k) or 0) for k in ("active_devices", "total_users", "total_readings")}
+        _status_counts_at = now
+    return _status_counts
+
 # Background task to send periodic updates
 async def periodic_status_updates():
     """Send periodic status updates to connected clients"""
     while True:
         try:
-            # Get system status
-            device_count = db_helper.execute_query("SELECT COUNT(*) as count FROM app.Analyzers WHERE IsActive = 1")
-            user_count = db_helper.execute_query("SELECT COUNT(*) as count FROM app.Users WHERE IsActive = 1")
-            reading_count = db_helper.execute_query("SELECT COUNT(*) as count FROM app.Readings")
-
+            if not await ws_manager.claim_periodic("status", 25):
+                # Another worker publishes this interval's status
+                await asyncio.sleep(30)
+                continue
+            # Get system status (one round trip, off the event loop)
             status_data = {
-                "active_devices": device_count[0]["count"] if device_count else 0,
-                "total_users": user_count[0]["count"] if user_count else 0,
-                "total_readings": reading_count[0]["count"] if reading_count else 0,
+                **await asyncio.to_thread(get_status_counts),
                 "timestamp": datetime.utcnow().isoformat()
             }
 
@@ -24,21 +24,26 @@ conn_str = (
 )
 
 try:
-    conn = pyodbc.connect(conn_str)
+    # CREATE DATABASE is not allowed inside a transaction
+    conn = pyodbc.connect(conn_str, autocommit=True)
     cursor = conn.cursor()
 
-    # Check if database exists
-    cursor.execute("SELECT name FROM sys.databases WHERE name = 'PAC3220DB'")
-    exists = cursor.fetchone()
-
-    if exists:
-        print("Database PAC3220DB already exists")
-    else:
-        print("Creating database PAC3220DB...")
-        cursor.execute("CREATE DATABASE PAC3220DB")
+    # Check and create in one server-side batch. The check is not atomic: a concurrent run can
+    # create the database in between, so "already exists" (1801) also counts as not created.
+    cursor.execute(
+        "IF DB_ID('PAC3220DB') IS NOT NULL SELECT 0 AS Created "
+        "ELSE BEGIN "
+        "BEGIN TRY CREATE DATABASE PAC3220DB; SELECT 1 AS Created; END TRY "
+        "BEGIN CATCH IF ERROR_NUMBER() = 1801 SELECT 0 AS Created; ELSE THROW; END CATCH "
+        "END"
+    )
+    created = cursor.fetchone()[0]
+
+    if created:
         print("Database PAC3220DB created successfully")
+    else:
+        print("Database PAC3220DB already exists")
 
-    conn.commit()
     conn.close()
     print("Database setup complete")
 
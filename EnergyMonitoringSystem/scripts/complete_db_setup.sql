@@ -349,7 +349,7 @@ CREATE TABLE app.DigitalOutputCommands (
     RequestedBy INT NOT NULL FOREIGN KEY REFERENCES app.Users(UserID),
     RequestedAt DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
     ExecutedAt DATETIME2 NULL,
-    ExecutionResult NVARCHAR(20) NOT NULL DEFAULT 'PENDING' CHECK (ExecutionResult IN ('PENDING', 'SUCCESS', 'FAILED', 'TIMEOUT')),
+    ExecutionResult NVARCHAR(20) NOT NULL DEFAULT 'PENDING' CHECK (ExecutionResult IN ('PENDING', 'IN_PROGRESS', 'SUCCESS', 'FAILED', 'TIMEOUT')),
     RetryCount INT NOT NULL DEFAULT 0,
     MaxRetries INT NOT NULL DEFAULT 3,
     ErrorMessage NVARCHAR(MAX),
@@ -465,7 +465,7 @@ CREATE TABLE ops.EmailQueue (
     Priority NVARCHAR(20) NOT NULL DEFAULT 'NORMAL' CHECK (Priority IN ('LOW','NORMAL','HIGH','CRITICAL')),
     QueuedAt DATETIME2 NOT NULL DEFAULT GETUTCDATE(),
     SentAt DATETIME2 NULL,
-    SendStatus NVARCHAR(20) NOT NULL DEFAULT 'PENDING' CHECK (SendStatus IN ('PENDING','SENT','FAILED'))
+    SendStatus NVARCHAR(20) NOT NULL DEFAULT 'PENDING' CHECK (SendStatus IN ('PENDING','SENDING','SENT','FAILED'))
 );
 GO
 
@@ -1203,3 +1203,439 @@ IF NOT EXISTS (
 BEGIN
     EXEC('CREATE PROCEDURE app.sp_SetUserAlertFlags @UserID INT, @Sent80 BIT, @AutoOn BIT AS BEGIN SET NOCOUNT ON; UPDATE app.Users SET Sent80PercentWarning=@Sent80, DoAutoOnTriggered=@AutoOn WHERE UserID=@UserID; END');
 END
+GO
+
+-- Modbus diagnostics of a DO control event (one row per do_control/do_control_failed event)
+IF OBJECT_ID(N'ops.DoEventDetails', N'U') IS NULL
+BEGIN
+    CREATE TABLE ops.DoEventDetails (
+        EventID BIGINT NOT NULL PRIMARY KEY FOREIGN KEY REFERENCES ops.Events(EventID) ON DELETE CASCADE,
+        WriteReg INT NULL,
+        ReadReg INT NULL,
+        ReadBack INT NULL,
+        ErrorMessage NVARCHAR(400) NULL
+    );
+END
+GO
+
+-- Record a DO state change: status row update + event log in one round-trip.
+-- Write/read registers, read-back value and error go to ops.DoEventDetails.
+-- @IsAutoOn=1 (successful auto-on after exhaustion) also logs auto_on_executed
+-- and flags the owning user's DoAutoOnTriggered.
+CREATE OR ALTER PROCEDURE app.sp_RecordDoEvent
+    @AnalyzerID INT,
+    @CoilAddress INT,
+    @NewState BIT = NULL,
+    @Source NVARCHAR(100),
+    @Success BIT,
+    @MetaData NVARCHAR(MAX) = NULL,
+    @IsAutoOn BIT = 0,
+    @WriteReg INT = NULL,
+    @ReadReg INT = NULL,
+    @ReadBack INT = NULL,
+    @ErrorMessage NVARCHAR(400) = NULL
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    BEGIN TRANSACTION;
+
+    UPDATE app.DigitalOutputStatus SET
+        State = @NewState,
+        LastUpdated = GETUTCDATE(),
+        UpdateSource = @Source
+    WHERE AnalyzerID = @AnalyzerID AND CoilAddress = @CoilAddress;
+
+    INSERT INTO ops.Events (AnalyzerID, Level, EventType, Message, Source, MetaData, Timestamp)
+    VALUES (
+        @AnalyzerID,
+        CASE WHEN @Success = 1 THEN 'INFO' ELSE 'ERROR' END,
+        CASE WHEN @Success = 1 THEN 'do_control' ELSE 'do_control_failed' END,
+        CASE @NewState WHEN 1 THEN 'DO ON' WHEN 0 THEN 'DO OFF' ELSE 'DO UNKNOWN' END,
+        @Source, @MetaData, GETUTCDATE()
+    );
+
+    IF @WriteReg IS NOT NULL OR @ReadReg IS NOT NULL OR @ReadBack IS NOT NULL OR @ErrorMessage IS NOT NULL
+        INSERT INTO ops.DoEventDetails (EventID, WriteReg, ReadReg, ReadBack, ErrorMessage)
+        VALUES (SCOPE_IDENTITY(), @WriteReg, @ReadReg, @ReadBack, @ErrorMessage);
+
+    IF @IsAutoOn = 1
+    BEGIN
+        INSERT INTO ops.Events (AnalyzerID, Level, EventType, Message, Source, MetaData, Timestamp)
+        VALUES (@AnalyzerID, 'INFO', 'auto_on_executed', 'Auto ON executed', @Source, @MetaData, GETUTCDATE());
+
+        UPDATE u SET DoAutoOnTriggered = 1
+        FROM app.Users u
+        JOIN app.Analyzers a ON a.UserID = u.UserID
+        WHERE a.AnalyzerID = @AnalyzerID;
+    END
+
+    COMMIT TRANSACTION;
+END
+GO
+
+-- Auto-cutoff / auto-restore: enqueue OFF at >=100% usage and ON below it for every
+-- breaker-enabled analyzer in one set-based pass. Skips outputs whose recorded state
+-- already matches, and (analyzer, coil, command) that already have a PENDING/IN_PROGRESS
+-- row inside the duplicate window. With @QueueCutoffEmails = 1 (alerts enabled), users whose
+-- supply was just switched OFF get a notification in ops.EmailQueue (delivered by the API's
+-- email queue task).
+CREATE OR ALTER PROCEDURE app.sp_EnforceAutoLimit
+    @DuplicateWindowSeconds INT = 60,
+    @MaxRetries INT = 3,
+    @RequestedBy INT = 1,
+    @QueueCutoffEmails BIT = 0
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @Enqueued TABLE (AnalyzerID INT, Command NVARCHAR(10));
+
+    ;WITH Targets AS (
+        SELECT
+            a.AnalyzerID,
+            ISNULL(a.BreakerCoilAddress, 0) AS CoilAddress,
+            CASE
+                WHEN ISNULL(u.AllocatedKWh, 0) > 0 AND ISNULL(u.UsedKWh, 0) >= u.AllocatedKWh THEN 'OFF'
+                WHEN ISNULL(u.AllocatedKWh, 0) <= 0 AND ISNULL(u.UsedKWh, 0) > 0 THEN 'OFF'
+                ELSE 'ON'
+            END AS Command
+        FROM app.Users u
+        JOIN app.Analyzers a ON a.UserID = u.UserID
+        WHERE ISNULL(u.IsActive, 1) = 1
+          AND a.IsActive = 1
+          AND ISNULL(a.BreakerEnabled, 0) = 1
+          AND ISNULL(a.BreakerCoilAddress, 0) BETWEEN 0 AND 9999
+    )
+    INSERT INTO app.DigitalOutputCommands (AnalyzerID, CoilAddress, Command, RequestedBy, MaxRetries, Notes)
+    OUTPUT inserted.AnalyzerID, inserted.Command INTO @Enqueued
+    SELECT
+        t.AnalyzerID, t.CoilAddress, t.Command, @RequestedBy, @MaxRetries,
+        CASE t.Command
+            WHEN 'OFF' THEN 'source=auto_limit;reason=Units exceeded 100%'
+            ELSE 'source=auto_restore;reason=Recharge completed'
+        END
+    FROM Targets t
+    LEFT JOIN app.DigitalOutputStatus s ON s.AnalyzerID = t.AnalyzerID AND s.CoilAddress = t.CoilAddress
+    WHERE (s.State IS NULL OR s.State <> CASE t.Command WHEN 'ON' THEN 1 ELSE 0 END)
+      AND NOT EXISTS (
+        SELECT 1 FROM app.DigitalOutputCommands c
+        WHERE c.AnalyzerID = t.AnalyzerID
+          AND c.CoilAddress = t.CoilAddress
+          AND c.Command = t.Command
+          AND c.ExecutionResult IN ('PENDING', 'IN_PROGRESS')
+          AND c.RequestedAt >= DATEADD(SECOND, -@DuplicateWindowSeconds, GETUTCDATE())
+    );
+
+    IF @QueueCutoffEmails = 0
+        RETURN;
+
+    INSERT INTO ops.EmailQueue (UserID, EmailTo, Subject, Body, Priority)
+    SELECT DISTINCT
+        u.UserID, u.Email,
+        N'Energy Limit Exhausted — Supply Disabled',
+        CONCAT(
+            N'<p>Dear ', ISNULL(u.FullName, u.Username), N',</p>',
+            N'<p>Your allocated energy units are fully consumed (100%). The system has switched OFF your supply automatically.</p>',
+            N'<p>Please recharge to restore service.</p>'
+        ),
+        'HIGH'
+    FROM @Enqueued e
+    JOIN app.Analyzers a ON a.AnalyzerID = e.AnalyzerID
+    JOIN app.Users u ON u.UserID = a.UserID
+    WHERE e.Command = 'OFF' AND u.Email IS NOT NULL AND u.Email <> '';
+END
+GO
+
+-- Pending and in-flight DO commands: app.sp_ClaimDoCommands scans only this filtered index in
+-- RequestedAt order, so its cost tracks queued plus claimed rows rather than the whole command history
+IF EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DOC_Pending' AND object_id = OBJECT_ID('app.DigitalOutputCommands')
+           AND filter_definition NOT LIKE '%IN_PROGRESS%')
+BEGIN
+    DROP INDEX IX_DOC_Pending ON app.DigitalOutputCommands;
+END
+GO
+
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DOC_Pending' AND object_id = OBJECT_ID('app.DigitalOutputCommands'))
+BEGIN
+    CREATE INDEX IX_DOC_Pending ON app.DigitalOutputCommands (RequestedAt)
+    INCLUDE (ExecutionResult, ExecutedAt, AnalyzerID, CoilAddress, Command, Notes, RequestedBy, MaxRetries, RetryCount)
+    WHERE ExecutionResult IN ('PENDING', 'IN_PROGRESS');
+END
+GO
+
+-- Superseded by app.sp_ClaimDoCommands; removed from databases created before the worker claimed commands
+DROP PROCEDURE IF EXISTS app.sp_GetPendingDO;
+GO
+
+-- Batch of DO command results for sp_UpdateDigitalOutputResultBatch
+IF TYPE_ID(N'app.DOResultTVP') IS NULL
+BEGIN
+    CREATE TYPE app.DOResultTVP AS TABLE (
+        CommandID BIGINT NOT NULL PRIMARY KEY,
+        ExecutionResult NVARCHAR(20) NOT NULL,
+        ErrorMessage NVARCHAR(MAX) NULL
+    );
+END
+GO
+
+-- Set-based sp_UpdateDigitalOutputResult: one call records all results of a worker batch
+CREATE OR ALTER PROCEDURE app.sp_UpdateDigitalOutputResultBatch
+    @Results app.DOResultTVP READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+    SET XACT_ABORT ON;
+
+    BEGIN TRANSACTION;
+
+    UPDATE c SET
+        ExecutedAt = GETUTCDATE(),
+        ExecutionResult = r.ExecutionResult,
+        ErrorMessage = r.ErrorMessage
+    FROM app.DigitalOutputCommands c
+    JOIN @Results r ON r.CommandID = c.CommandID;
+
+    -- Latest successful ON/OFF per coil wins when a batch holds several for the same output
+    ;WITH Latest AS (
+        SELECT c.AnalyzerID, c.CoilAddress, c.RequestedBy,
+               CASE c.Command WHEN 'ON' THEN 1 ELSE 0 END AS State,
+               ROW_NUMBER() OVER (PARTITION BY c.AnalyzerID, c.CoilAddress ORDER BY c.CommandID DESC) AS rn
+        FROM @Results r
+        JOIN app.DigitalOutputCommands c ON c.CommandID = r.CommandID
+        WHERE r.ExecutionResult = 'SUCCESS' AND c.Command IN ('ON', 'OFF')
+    )
+    MERGE app.DigitalOutputStatus AS target
+    USING (SELECT AnalyzerID, CoilAddress, State, RequestedBy FROM Latest WHERE rn = 1) AS source
+    ON target.AnalyzerID = source.AnalyzerID AND target.CoilAddress = source.CoilAddress
+    WHEN MATCHED THEN
+        UPDATE SET State = source.State, LastUpdated = GETUTCDATE(), UpdatedBy = source.RequestedBy, UpdateSource = 'ADMIN'
+    WHEN NOT MATCHED THEN
+        INSERT (AnalyzerID, CoilAddress, State, UpdatedBy, UpdateSource)
+        VALUES (source.AnalyzerID, source.CoilAddress, source.State, source.RequestedBy, 'ADMIN');
+
+    INSERT INTO ops.Events (AnalyzerID, UserID, Level, EventType, Message, Source, MetaData)
+    SELECT
+        c.AnalyzerID,
+        c.RequestedBy,
+        CASE WHEN r.ExecutionResult = 'SUCCESS' THEN 'INFO' ELSE 'ERROR' END,
+        'do_control',
+        CONCAT('Digital output control: ', r.ExecutionResult, ' for coil ', c.CoilAddress),
+        'API',
+        CONCAT('{"command_id":', r.CommandID, ',"result":"', r.ExecutionResult, '"}')
+    FROM @Results r
+    JOIN app.DigitalOutputCommands c ON c.CommandID = r.CommandID;
+
+    COMMIT TRANSACTION;
+END
+GO
+
+-- Allow IN_PROGRESS on databases created before the DO worker claimed commands
+DECLARE @DocCheck sysname;
+SELECT @DocCheck = name FROM sys.check_constraints
+WHERE parent_object_id = OBJECT_ID('app.DigitalOutputCommands')
+  AND definition LIKE '%ExecutionResult%' AND definition NOT LIKE '%IN_PROGRESS%';
+IF @DocCheck IS NOT NULL
+BEGIN
+    EXEC('ALTER TABLE app.DigitalOutputCommands DROP CONSTRAINT ' + @DocCheck);
+    ALTER TABLE app.DigitalOutputCommands ADD CONSTRAINT CK_DigitalOutputCommands_ExecutionResult
+        CHECK (ExecutionResult IN ('PENDING', 'IN_PROGRESS', 'SUCCESS', 'FAILED', 'TIMEOUT'));
+END
+GO
+
+-- Atomically claim the oldest pending DO commands for a worker batch (PENDING -> IN_PROGRESS).
+-- READPAST lets concurrent workers skip rows another worker is claiming. Claims older than
+-- @StaleSeconds (worker died mid-batch) are handed out again, except TOGGLE: the device may
+-- already have flipped, so replaying it could undo the switch and those rows are failed instead.
+-- ExecutedAt holds the claim time until the result is written.
+CREATE OR ALTER PROCEDURE app.sp_ClaimDoCommands
+    @Limit INT = 20,
+    @StaleSeconds INT = 300
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @Claimed TABLE (CommandID BIGINT PRIMARY KEY);
+    DECLARE @StaleBefore DATETIME2 = DATEADD(SECOND, -@StaleSeconds, GETUTCDATE());
+
+    UPDATE app.DigitalOutputCommands WITH (READPAST, ROWLOCK) SET
+        ExecutionResult = 'FAILED',
+        ExecutedAt = GETUTCDATE(),
+        ErrorMessage = 'stale_toggle_not_retried'
+    WHERE ExecutionResult = 'IN_PROGRESS'
+      AND Command = 'TOGGLE'
+      AND ExecutedAt < @StaleBefore;
+
+    ;WITH NextBatch AS (
+        SELECT TOP (@Limit) CommandID, ExecutionResult, ExecutedAt
+        FROM app.DigitalOutputCommands WITH (READPAST, UPDLOCK, ROWLOCK)
+        WHERE ExecutionResult = 'PENDING'
+           OR (ExecutionResult = 'IN_PROGRESS' AND Command <> 'TOGGLE' AND ExecutedAt < @StaleBefore)
+        ORDER BY RequestedAt ASC
+    )
+    UPDATE NextBatch SET
+        ExecutionResult = 'IN_PROGRESS',
+        ExecutedAt = GETUTCDATE()
+    OUTPUT inserted.CommandID INTO @Claimed;
+
+    SELECT c.CommandID, c.AnalyzerID, c.CoilAddress, c.Command, c.Notes,
+           c.RequestedBy, c.MaxRetries, ISNULL(c.RetryCount, 0) as RetryCount,
+           a.IPAddress, a.ModbusID, s.State as CurrentState
+    FROM @Claimed k
+    JOIN app.DigitalOutputCommands c ON c.CommandID = k.CommandID
+    JOIN app.Analyzers a ON c.AnalyzerID = a.AnalyzerID
+    LEFT JOIN app.DigitalOutputStatus s ON s.AnalyzerID = c.AnalyzerID AND s.CoilAddress = c.CoilAddress
+    ORDER BY c.RequestedAt ASC;
+END
+GO
+
+-- Batch of email queue outcomes for sp_UpdateEmailQueueStatus
+IF TYPE_ID(N'app.EmailStatusTVP') IS NULL
+BEGIN
+    CREATE TYPE app.EmailStatusTVP AS TABLE (
+        EmailID BIGINT NOT NULL PRIMARY KEY,
+        SendStatus NVARCHAR(20) NOT NULL
+    );
+END
+GO
+
+-- Record the outcome of a whole email queue run in one call
+CREATE OR ALTER PROCEDURE app.sp_UpdateEmailQueueStatus
+    @Results app.EmailStatusTVP READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    UPDATE q SET
+        SendStatus = r.SendStatus,
+        SentAt = CASE WHEN r.SendStatus = 'SENT' THEN GETUTCDATE() END
+    FROM ops.EmailQueue q
+    JOIN @Results r ON r.EmailID = q.EmailID;
+END
+GO
+
+-- Allow SENDING on databases created before the email drain claimed rows
+DECLARE @EmailCheck sysname;
+SELECT @EmailCheck = name FROM sys.check_constraints
+WHERE parent_object_id = OBJECT_ID('ops.EmailQueue')
+  AND definition LIKE '%SendStatus%' AND definition NOT LIKE '%SENDING%';
+IF @EmailCheck IS NOT NULL
+BEGIN
+    EXEC('ALTER TABLE ops.EmailQueue DROP CONSTRAINT ' + @EmailCheck);
+    ALTER TABLE ops.EmailQueue ADD CONSTRAINT CK_EmailQueue_SendStatus
+        CHECK (SendStatus IN ('PENDING', 'SENDING', 'SENT', 'FAILED'));
+END
+GO
+
+-- Atomically claim the next queued emails for a drain run (PENDING -> SENDING), highest
+-- priority first. READPAST lets drains in other API workers skip rows already being claimed,
+-- so no email is sent twice. Claims older than @StaleSeconds (drain died mid-run) are handed
+-- out again. SentAt holds the claim time until the outcome is written.
+CREATE OR ALTER PROCEDURE app.sp_ClaimEmailQueue
+    @Limit INT = 50,
+    @StaleSeconds INT = 900
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    ;WITH NextBatch AS (
+        SELECT TOP (@Limit) EmailID, EmailTo, Subject, Body, Priority, SendStatus, SentAt
+        FROM ops.EmailQueue WITH (READPAST, UPDLOCK, ROWLOCK)
+        WHERE SendStatus = 'PENDING'
+           OR (SendStatus = 'SENDING' AND SentAt < DATEADD(SECOND, -@StaleSeconds, GETUTCDATE()))
+        ORDER BY CASE WHEN Priority = 'CRITICAL' THEN 3 WHEN Priority = 'HIGH' THEN 2 ELSE 1 END DESC, QueuedAt ASC
+    )
+    UPDATE NextBatch SET
+        SendStatus = 'SENDING',
+        SentAt = GETUTCDATE()
+    OUTPUT inserted.EmailID, inserted.EmailTo, inserted.Subject, inserted.Body, inserted.Priority;
+END
+GO
+
+-- sp_EnforceAutoLimit's duplicate-window NOT EXISTS runs once per breaker-enabled analyzer on
+-- every DO worker pass; it seeks on (AnalyzerID, CoilAddress, Command) over the small set of
+-- open commands instead of scanning the command history
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_DOCmd_Pending_Dedup' AND object_id = OBJECT_ID('app.DigitalOutputCommands'))
+BEGIN
+    CREATE INDEX IX_DOCmd_Pending_Dedup ON app.DigitalOutputCommands (AnalyzerID, CoilAddress, Command, RequestedAt)
+    WHERE ExecutionResult IN ('PENDING', 'IN_PROGRESS');
+END
+GO
+
+-- Batch of readings for sp_InsertReadingsBatch; Seq gives the order rows are applied in
+IF TYPE_ID(N'app.ReadingBatchTVP') IS NULL
+BEGIN
+    CREATE TYPE app.ReadingBatchTVP AS TABLE (
+        Seq INT NOT NULL PRIMARY KEY,
+        AnalyzerID INT NOT NULL,
+        KW_L1 DECIMAL(8,3) NULL,
+        KW_L2 DECIMAL(8,3) NULL,
+        KW_L3 DECIMAL(8,3) NULL,
+        KW_Total DECIMAL(8,3) NULL,
+        KWh_L1 DECIMAL(12,3) NULL,
+        KWh_L2 DECIMAL(12,3) NULL,
+        KWh_L3 DECIMAL(12,3) NULL,
+        KWh_Total DECIMAL(12,3) NULL,
+        VL1 DECIMAL(6,2) NULL,
+        VL2 DECIMAL(6,2) NULL,
+        VL3 DECIMAL(6,2) NULL,
+        IL1 DECIMAL(8,3) NULL,
+        IL2 DECIMAL(8,3) NULL,
+        IL3 DECIMAL(8,3) NULL,
+        ITotal DECIMAL(8,3) NULL,
+        Hz DECIMAL(5,2) NULL,
+        PF_L1 DECIMAL(3,2) NULL,
+        PF_L2 DECIMAL(3,2) NULL,
+        PF_L3 DECIMAL(3,2) NULL,
+        PF_Avg DECIMAL(3,2) NULL,
+        KWh_Grid DECIMAL(12,3) NULL,
+        KWh_Generator DECIMAL(12,3) NULL,
+        Quality NVARCHAR(20) NOT NULL DEFAULT 'GOOD'
+    );
+END
+GO
+
+-- Insert several readings in one call. Each row goes through sp_InsertReading in Seq order,
+-- so deltas, billing and alerts behave exactly as for individual calls.
+CREATE OR ALTER PROCEDURE app.sp_InsertReadingsBatch
+    @Batch app.ReadingBatchTVP READONLY
+AS
+BEGIN
+    SET NOCOUNT ON;
+
+    DECLARE @AnalyzerID INT, @KW_L1 DECIMAL(8,3), @KW_L2 DECIMAL(8,3), @KW_L3 DECIMAL(8,3), @KW_Total DECIMAL(8,3),
+            @KWh_L1 DECIMAL(12,3), @KWh_L2 DECIMAL(12,3), @KWh_L3 DECIMAL(12,3), @KWh_Total DECIMAL(12,3),
+            @VL1 DECIMAL(6,2), @VL2 DECIMAL(6,2), @VL3 DECIMAL(6,2),
+            @IL1 DECIMAL(8,3), @IL2 DECIMAL(8,3), @IL3 DECIMAL(8,3), @ITotal DECIMAL(8,3),
+            @Hz DECIMAL(5,2), @PF_L1 DECIMAL(3,2), @PF_L2 DECIMAL(3,2), @PF_L3 DECIMAL(3,2), @PF_Avg DECIMAL(3,2),
+            @KWh_Grid DECIMAL(12,3), @KWh_Generator DECIMAL(12,3), @Quality NVARCHAR(20);
+
+    DECLARE batch_cursor CURSOR LOCAL FAST_FORWARD FOR
+        SELECT AnalyzerID, KW_L1, KW_L2, KW_L3, KW_Total, KWh_L1, KWh_L2, KWh_L3, KWh_Total,
+               VL1, VL2, VL3, IL1, IL2, IL3, ITotal, Hz, PF_L1, PF_L2, PF_L3, PF_Avg,
+               KWh_Grid, KWh_Generator, Quality
+        FROM @Batch
+        ORDER BY Seq;
+
+    OPEN batch_cursor;
+    FETCH NEXT FROM batch_cursor INTO @AnalyzerID, @KW_L1, @KW_L2, @KW_L3, @KW_Total, @KWh_L1, @KWh_L2, @KWh_L3, @KWh_Total,
+        @VL1, @VL2, @VL3, @IL1, @IL2, @IL3, @ITotal, @Hz, @PF_L1, @PF_L2, @PF_L3, @PF_Avg,
+        @KWh_Grid, @KWh_Generator, @Quality;
+    WHILE @@FETCH_STATUS = 0
+    BEGIN
+        EXEC app.sp_InsertReading
+            @AnalyzerID = @AnalyzerID, @KW_L1 = @KW_L1, @KW_L2 = @KW_L2, @KW_L3 = @KW_L3, @KW_Total = @KW_Total,
+            @KWh_L1 = @KWh_L1, @KWh_L2 = @KWh_L2, @KWh_L3 = @KWh_L3, @KWh_Total = @KWh_Total,
+            @VL1 = @VL1, @VL2 = @VL2, @VL3 = @VL3, @IL1 = @IL1, @IL2 = @IL2, @IL3 = @IL3, @ITotal = @ITotal,
+            @Hz = @Hz, @PF_L1 = @PF_L1, @PF_L2 = @PF_L2, @PF_L3 = @PF_L3, @PF_Avg = @PF_Avg,
+            @KWh_Grid = @KWh_Grid, @KWh_Generator = @KWh_Generator, @Quality = @Quality;
+
+        FETCH NEXT FROM batch_cursor INTO @AnalyzerID, @KW_L1, @KW_L2, @KW_L3, @KW_Total, @KWh_L1, @KWh_L2, @KWh_L3, @KWh_Total,
+            @VL1, @VL2, @VL3, @IL1, @IL2, @IL3, @ITotal, @Hz, @PF_L1, @PF_L2, @PF_L3, @PF_Avg,
+            @KWh_Grid, @KWh_Generator, @Quality;
+    END
+    CLOSE batch_cursor;
+    DEALLOCATE batch_cursor;
+END
+GO
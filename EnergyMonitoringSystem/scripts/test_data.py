@@ -3,80 +3,85 @@
 Test data insertion script for PAC3220 Energy Monitoring System
 """
 
-import os
-import pyodbc
-from dotenv import load_dotenv
+import itertools
+import sys
 
-# Load environment variables
-load_dotenv()
-
-# Database connection string
-DATABASE_URL = os.getenv("DATABASE_URL")
+from backend.dal.database import db_helper
 
 def insert_test_data():
     """Insert test users and devices into the database"""
     try:
-        conn = pyodbc.connect(DATABASE_URL)
-        cursor = conn.cursor()
-
-        print("Connected to database. Inserting test data...")
-
-        # Insert test user
-        cursor.execute("""
-            INSERT INTO app.Users (Username, PasswordHash, Email, FullName, Role, IsActive)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, ('testuser', '$2a$10$N9qo8uLOickgx2ZMRZoMyeIXFf9nVq6XG8K5vZ6XG8K5vZ6XG8K5v', 'test@example.com', 'Test User', 'User', 1))
-
-        # Insert test admin
-        cursor.execute("""
-            INSERT INTO app.Users (Username, PasswordHash, Email, FullName, Role, IsActive)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, ('admin', '$2a$10$N9qo8uLOickgx2ZMRZoMyeIXFf9nVq6XG8K5vZ6XG8K5vZ6XG8K5v', 'admin@example.com', 'Admin User', 'Admin', 1))
-
-        # Insert test analyzer
-        cursor.execute("""
-            INSERT INTO app.Analyzers (AnalyzerID, Name, IPAddress, Port, ModbusID, UserID, AllocatedKWh, Status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (3, 'PAC3220-001', '192.168.10.2', 502, 1, 1, 1000.0, 'Active'))
-
-        # Insert initial reading
-        cursor.execute("""
-            INSERT INTO app.Readings (
-                AnalyzerID, KW_L1, KW_L2, KW_L3, KW_Total,
-                KWh_L1, KWh_L2, KWh_L3, KWh_Total,
-                VL1, VL2, VL3, IL1, IL2, IL3, ITotal,
-                Hz, PF_L1, PF_L2, PF_L3, PF_Avg,
-                KWh_Grid, KWh_Generator, Quality
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            3,  # AnalyzerID
-            0.0, None, None, 0.0,  # KW_L1, KW_L2=NULL, KW_L3=NULL, KW_Total
-            None, None, None, 100.0,  # KWh_L1=NULL, KWh_L2=NULL, KWh_L3=NULL, KWh_Total
-            220.0, 220.0, 220.0, 0.0, 0.0, 0.0, 0.0,  # VL1, VL2, VL3, IL1, IL2, IL3, ITotal
-            50.0, None, None, None, 1.0,  # Hz, PF_L1=NULL, PF_L2=NULL, PF_L3=NULL, PF_Avg
-            100.0, 0.0, 'GOOD'  # KWh_Grid, KWh_Generator, Quality
-        ))
-
-        conn.commit()
-        print("✅ Test data inserted successfully!")
-
-        # Show results
-        cursor.execute("SELECT UserID, Username, Role FROM app.Users")
-        print("\nUsers:")
-        for row in cursor.fetchall():
-            print(f"  ID: {row[0]}, Username: {row[1]}, Role: {row[2]}")
-
-        cursor.execute("SELECT AnalyzerID, Name, IPAddress, Status FROM app.Analyzers")
-        print("\nAnalyzers:")
-        for row in cursor.fetchall():
-            print(f"  ID: {row[0]}, Name: {row[1]}, IP: {row[2]}, Status: {row[3]}")
-
-        cursor.execute("SELECT COUNT(*) FROM app.Readings WHERE AnalyzerID = 3")
-        count = cursor.fetchone()[0]
-        print(f"\nReadings for analyzer 3: {count}")
-
-        conn.close()
-        print("✅ Database connection closed.")
+        # Pooled connection from the backend (DB_* settings); not autocommit, so the inserts commit together
+        with db_helper.db_conn.get_connection() as conn:
+            cursor = conn.cursor()
+
+            print("Connected to database. Inserting test data...")
+
+            # Multi-row inserts are sent as one parameter array instead of one round trip per row;
+            # everything below commits together at the end
+            cursor.fast_executemany = True
+
+            # Insert test user and test admin
+            users_rows = [
+                ('testuser', '$2a$10$N9qo8uLOickgx2ZMRZoMyeIXFf9nVq6XG8K5vZ6XG8K5vZ6XG8K5v', 'test@example.com', 'Test User', 'User', 1),
+                ('admin', '$2a$10$N9qo8uLOickgx2ZMRZoMyeIXFf9nVq6XG8K5vZ6XG8K5vZ6XG8K5v', 'admin@example.com', 'Admin User', 'Admin', 1),
+            ]
+            cursor.executemany("""
+                INSERT INTO app.Users (Username, PasswordHash, Email, FullName, Role, IsActive)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, users_rows)
+
+            # Insert test analyzer
+            cursor.execute("""
+                INSERT INTO app.Analyzers (AnalyzerID, Name, IPAddress, Port, ModbusID, UserID, AllocatedKWh, Status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (3, 'PAC3220-001', '192.168.10.2', 502, 1, 1, 1000.0, 'Active'))
+
+            # Insert initial readings as multi-row VALUES statements, one round trip per chunk.
+            # Chunks stay under SQL Server's 2100-parameter limit per statement.
+            readings_rows = [(
+                3,  # AnalyzerID
+                0.0, None, None, 0.0,  # KW_L1, KW_L2=NULL, KW_L3=NULL, KW_Total
+                None, None, None, 100.0,  # KWh_L1=NULL, KWh_L2=NULL, KWh_L3=NULL, KWh_Total
+                220.0, 220.0, 220.0, 0.0, 0.0, 0.0, 0.0,  # VL1, VL2, VL3, IL1, IL2, IL3, ITotal
+                50.0, None, None, None, 1.0,  # Hz, PF_L1=NULL, PF_L2=NULL, PF_L3=NULL, PF_Avg
+                100.0, 0.0, 'GOOD'  # KWh_Grid, KWh_Generator, Quality
+            )]
+            row_placeholder = "(" + ", ".join(["?"] * len(readings_rows[0])) + ")"
+            chunk_rows = 2000 // len(readings_rows[0])
+            for start in range(0, len(readings_rows), chunk_rows):
+                chunk = readings_rows[start:start + chunk_rows]
+                cursor.execute("""
+                    INSERT INTO app.Readings (
+                        AnalyzerID, KW_L1, KW_L2, KW_L3, KW_Total,
+                        KWh_L1, KWh_L2, KWh_L3, KWh_Total,
+                        VL1, VL2, VL3, IL1, IL2, IL3, ITotal,
+                        Hz, PF_L1, PF_L2, PF_L3, PF_Avg,
+                        KWh_Grid, KWh_Generator, Quality
+                    ) VALUES """ + ", ".join([row_placeholder] * len(chunk)),
+                    list(itertools.chain.from_iterable(chunk)))
+
+            conn.commit()
+            print("✅ Test data inserted successfully!")
+
+            # Show results: all three reports in one batch, read with nextset()
+            cursor.execute("""
+                SELECT UserID, Username, Role FROM app.Users;
+                SELECT AnalyzerID, Name, IPAddress, Status FROM app.Analyzers;
+                SELECT COUNT(*) FROM app.Readings WHERE AnalyzerID = 3;
+            """)
+            lines = ["\nUsers:"]
+            lines.extend(f"  ID: {row[0]}, Username: {row[1]}, Role: {row[2]}" for row in cursor.fetchall())
+
+            cursor.nextset()
+            lines.append("\nAnalyzers:")
+            lines.extend(f"  ID: {row[0]}, Name: {row[1]}, IP: {row[2]}, Status: {row[3]}" for row in cursor.fetchall())
+
+            cursor.nextset()
+            count = cursor.fetchone()[0]
+            lines.append(f"\nReadings for analyzer 3: {count}")
+            # One write for the whole report instead of one per row
+            sys.stdout.write("\n".join(lines) + "\n")
 
     except Exception as e:
         print(f"❌ Error inserting test data: {e}")
@@ -88,10 +93,6 @@ if __name__ == "__main__":
     print("PAC3220 Test Data Insertion Script")
     print("=" * 40)
 
-    if not DATABASE_URL:
-        print("❌ DATABASE_URL environment variable not found!")
-        exit(1)
-
     success = insert_test_data()
     if success:
         print("\n🎉 Test data setup complete! The poller should now find active devices.")
@@ -8,6 +8,7 @@ import os
 import sys
 import subprocess
 import time
+import urllib.request
 from pathlib import Path
 
 def check_database_connection():
@@ -29,9 +30,8 @@ def start_backend_api():
     """Start the FastAPI backend server"""
     print("Starting Backend API...")
     try:
-        # Change to backend directory
-        backend_dir = Path(__file__).parent / "backend"
-        os.chdir(backend_dir)
+        # uvicorn runs from the backend directory; the supervisor's own cwd is left alone
+        backend_dir = Path(__file__).resolve().parent / "backend"
 
         # Start uvicorn server
         cmd = [
@@ -58,6 +58,38 @@ def start_worker():
         print(f"[ERROR] Failed to start worker: {e}")
         return None
 
+def wait_for_http(url, timeout=10.0):
+    """Wait until url answers 200; False on timeout.
+
+    A bare TCP probe is not enough: under --reload the uvicorn supervisor binds the port before the
+    worker has imported the app, so only a real response shows the API is up.
+    """
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except OSError:
+            pass
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+def wait_for_exit(processes):
+    """Block until one of the child processes exits and return its (name, process)"""
+    while True:
+        if hasattr(os, "waitid"):
+            # Sleep in the kernel until a child exits; WNOWAIT leaves reaping to Popen.poll()
+            os.waitid(os.P_ALL, 0, os.WEXITED | os.WNOWAIT)
+        else:
+            time.sleep(1)
+        for name, process in processes:
+            if process.poll() is not None:
+                return name, process
+
 def main():
     """Main startup function"""
     print("=" * 60)
@@ -73,19 +105,17 @@ def main():
     processes = []
 
     try:
-        # Start backend API
-        api_process = start_backend_api()
-        if api_process:
-            processes.append(("Backend API", api_process))
-
-        # Wait a moment for API to start
-        time.sleep(3)
-
-        # Start worker
+        # Start both services right away; the worker does not depend on the API
         worker_process = start_worker()
         if worker_process:
             processes.append(("Command Worker", worker_process))
 
+        api_process = start_backend_api()
+        if api_process:
+            processes.append(("Backend API", api_process))
+            if not wait_for_http("http://localhost:8000/health"):
+                print("[WARNING] Backend API is not answering /health on port 8000 yet")
+
         print("\n" + "=" * 60)
         print("SYSTEM STARTUP COMPLETE")
         print("=" * 60)
@@ -103,9 +133,11 @@ def main():
         print("Press Ctrl+C to stop all services")
         print("=" * 60)
 
-        # Keep running until interrupted
-        while True:
-            time.sleep(1)
+        # Keep running until interrupted or a service exits
+        if processes:
+            name, process = wait_for_exit(processes)
+            print(f"\n[ERROR] {name} exited with code {process.returncode}")
+            print("Shutting down services...")
 
     except KeyboardInterrupt:
         print("\n\nShutting down services...")
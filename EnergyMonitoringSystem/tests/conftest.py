@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Make the backend importable both as the `backend` package and by its top-level modules (`api.*`)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(REPO_ROOT, "backend")
+for path in (BACKEND_DIR, REPO_ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+@pytest.fixture(scope="session")
+def admin_app():
+    # Admin router mounted once per run; imported lazily so path setup above applies
+    from api.routes_admin import router as admin_router
+
+    app = FastAPI()
+    app.include_router(admin_router, prefix="/api/admin")
+    return app
+
+
+@pytest.fixture(scope="session")
+def admin_client(admin_app):
+    return TestClient(admin_app)
+
+
+@pytest.fixture
+def dependency_overrides(admin_app):
+    # Per-test dependency overrides on the shared app, cleared at teardown
+    yield admin_app.dependency_overrides
+    admin_app.dependency_overrides.clear()
@@ -1,25 +1,9 @@
 import asyncio
-import os
-import sys
-from fastapi import FastAPI
-from fastapi.testclient import TestClient
-
-# Ensure backend package is importable in tests
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
-repo_root = os.path.join(project_root, "EnergyMonitoringSystem")
-backend_dir = os.path.join(repo_root, "backend")
-sys.path.insert(0, repo_root)
-sys.path.insert(0, backend_dir)
-
-from api.routes_admin import router as admin_router
-from backend.do_worker import process_pending_commands
 
+from backend.do_worker import process_pending_commands
 
-def test_do_end_to_end(monkeypatch):
-    app = FastAPI()
-    app.include_router(admin_router, prefix="/api/admin")
-    client = TestClient(app)
 
+def test_do_end_to_end(monkeypatch, dependency_overrides):
     store = {
         "commands": [],
         "updates": [],
@@ -29,25 +13,28 @@ def test_do_end_to_end(monkeypatch):
 
     def fake_get_current_user(credentials=None):
         return {"role": "Admin", "user_id": 1, "username": "admin"}
-    app.dependency_overrides[real_get_current_user] = fake_get_current_user
+    dependency_overrides[real_get_current_user] = fake_get_current_user
+
+    def _handle_control(params):
+        cmd = {
+            "CommandID": len(store["commands"]) + 1,
+            "AnalyzerID": params["@AnalyzerID"],
+            "CoilAddress": params["@CoilAddress"],
+            "Command": params["@Command"],
+            "RequestedBy": params["@RequestedBy"],
+            "MaxRetries": params["@MaxRetries"],
+            "IPAddress": "127.0.0.1",
+            "ModbusID": 1,
+        }
+        store["commands"].append(cmd)
+        return [cmd]
+
+    # Any other procedure (e.g. ops.sp_LogAuditEvent) just returns an empty row
+    sp_handlers = {"app.sp_ControlDigitalOutput": _handle_control}
 
     def fake_sp(name, params):
-        if name == "app.sp_ControlDigitalOutput":
-            cmd = {
-                "CommandID": len(store["commands"]) + 1,
-                "AnalyzerID": params["@AnalyzerID"],
-                "CoilAddress": params["@CoilAddress"],
-                "Command": params["@Command"],
-                "RequestedBy": params["@RequestedBy"],
-                "MaxRetries": params["@MaxRetries"],
-                "IPAddress": "127.0.0.1",
-                "ModbusID": 1,
-            }
-            store["commands"].append(cmd)
-            return [cmd]
-        if name == "ops.sp_LogAuditEvent":
-            return [{}]
-        return [{}]
+        handler = sp_handlers.get(name)
+        return handler(params) if handler else [{}]
 
     def fake_query(q, params=()):
         if "FROM app.DigitalOutputCommands" in q:
@@ -89,16 +76,34 @@ def test_do_end_to_end(monkeypatch):
         def execute_query(self, q, params=()):
             return fake_query(q, params)
     monkeypatch.setattr(ra, "db_helper", DummyDB())
-    monkeypatch.setattr(dw.db_helper, "execute_stored_procedure", lambda name, params: store["updates"].append((name, params)))
+
+    class DummyWorkerDB:
+        def execute_stored_procedure(self, name, params):
+            if name == "app.sp_ClaimDoCommands":
+                return fake_query("SELECT ... FROM app.DigitalOutputCommands", (params["@Limit"],))
+            store["updates"].append((name, params))
+        def execute_query(self, q, params=()):
+            # Batched results: a single TVP argument of (CommandID, ExecutionResult, ErrorMessage) rows
+            if "sp_UpdateDigitalOutputResultBatch" in q:
+                for command_id, result, error in params[0]:
+                    store["updates"].append(("app.sp_UpdateDigitalOutputResult", {"@CommandID": command_id, "@ExecutionResult": result, "@ErrorMessage": error}))
+        def execute_many(self, q, rows):
+            pass
+        def execute_nonquery_autocommit(self, q, params=()):
+            pass
+    monkeypatch.setattr(dw, "db_helper", DummyWorkerDB())
     monkeypatch.setattr(dw, "ModbusClient", DummyClient)
 
     from api.routes_admin import admin_do_enqueue, AdminDOEnqueueRequest
     req = AdminDOEnqueueRequest(analyzer_id=5, coil_address=1, command="OFF")
-    data = asyncio.get_event_loop().run_until_complete(admin_do_enqueue(req, fake_get_current_user()))
-    assert data["success"] is True
-    assert len(store["commands"]) == 1
 
-    asyncio.get_event_loop().run_until_complete(process_pending_commands())
+    async def scenario():
+        data = await admin_do_enqueue(req, fake_get_current_user())
+        assert data["success"] is True
+        assert len(store["commands"]) == 1
+        await process_pending_commands()
+
+    asyncio.run(scenario())
 
     assert len(store["updates"]) >= 1
     name, params = store["updates"][0]
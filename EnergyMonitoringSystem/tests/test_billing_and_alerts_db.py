@@ -1,10 +1,5 @@
-import os
-import sys
 from datetime import datetime
 
-# Ensure backend is on path
-sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'backend'))
-
 from backend.dal.database import db_helper
 
 
@@ -32,19 +27,40 @@ def _create_analyzer(user_id: int, serial: str):
     return int(rows[0]["AnalyzerID"]) if rows else None
 
 
+def _reading_row(seq: int, analyzer_id: int, kw_total: float, kwh_total: float,
+                 vl: tuple, il: tuple, itotal: float):
+    # Column order of app.ReadingBatchTVP; per-phase kW/kWh and PFs are left NULL
+    return (
+        seq, analyzer_id,
+        None, None, None, kw_total,
+        None, None, None, kwh_total,
+        vl[0], vl[1], vl[2], il[0], il[1], il[2], itotal,
+        50.0, None, None, None, 0.95,
+        kwh_total, 0.0, "GOOD",
+    )
+
+
+# Each DELETE is best-effort on its own (TRY/CATCH, no XACT_ABORT), so one failure does not
+# leave the other test rows behind; all of them still go in one round trip
+_CLEANUP_SQL = """
+SET NOCOUNT ON;
+BEGIN TRY DELETE FROM ops.BillingTransactions WHERE AnalyzerID = ?; END TRY BEGIN CATCH END CATCH;
+BEGIN TRY DELETE FROM app.Readings WHERE AnalyzerID = ?; END TRY BEGIN CATCH END CATCH;
+-- Remove dependent events before deleting analyzer to avoid FK conflicts
+BEGIN TRY DELETE FROM ops.Events WHERE AnalyzerID = ?; END TRY BEGIN CATCH END CATCH;
+BEGIN TRY DELETE FROM app.Analyzers WHERE AnalyzerID = ?; END TRY BEGIN CATCH END CATCH;
+BEGIN TRY DELETE FROM app.Alerts WHERE UserID = ?; END TRY BEGIN CATCH END CATCH;
+BEGIN TRY
+    IF OBJECT_ID(N'ops.EmailQueue', N'U') IS NOT NULL
+        DELETE FROM ops.EmailQueue WHERE UserID = ?;
+END TRY BEGIN CATCH END CATCH;
+BEGIN TRY DELETE FROM app.Users WHERE UserID = ?; END TRY BEGIN CATCH END CATCH;
+"""
+
+
 def _cleanup(user_id: int, analyzer_id: int):
     try:
-        db_helper.execute_query("DELETE FROM ops.BillingTransactions WHERE AnalyzerID = ?", (analyzer_id,))
-        db_helper.execute_query("DELETE FROM app.Readings WHERE AnalyzerID = ?", (analyzer_id,))
-        # Remove dependent events before deleting analyzer to avoid FK conflicts
-        db_helper.execute_query("DELETE FROM ops.Events WHERE AnalyzerID = ?", (analyzer_id,))
-        db_helper.execute_query("DELETE FROM app.Analyzers WHERE AnalyzerID = ?", (analyzer_id,))
-        db_helper.execute_query("DELETE FROM app.Alerts WHERE UserID = ?", (user_id,))
-        try:
-            db_helper.execute_query("DELETE FROM ops.EmailQueue WHERE UserID = ?", (user_id,))
-        except Exception:
-            pass
-        db_helper.execute_query("DELETE FROM app.Users WHERE UserID = ?", (user_id,))
+        db_helper.execute_query(_CLEANUP_SQL, (analyzer_id,) * 4 + (user_id,) * 3)
     except Exception:
         pass
 
@@ -61,77 +77,37 @@ def test_billing_and_alerts_flow():
         # Give small allocation to trigger alerts quickly
         db_helper.execute_query("UPDATE app.Users SET AllocatedKWh = 1 WHERE UserID = ?", (user_id,))
 
-        # Insert first reading: baseline
-        db_helper.execute_stored_procedure("app.sp_InsertReading", {
-            "@AnalyzerID": analyzer_id,
-            "@KW_Total": 0.5,
-            "@KWh_Total": 10.0,
-            "@VL1": 230.0,
-            "@VL2": 231.0,
-            "@VL3": 229.5,
-            "@IL1": 4.1,
-            "@IL2": 4.0,
-            "@IL3": 3.9,
-            "@ITotal": 4.0,
-            "@Hz": 50.0,
-            "@PF_Avg": 0.95,
-            "@KWh_Grid": 10.0,
-            "@KWh_Generator": 0.0,
-            "@Quality": "GOOD"
-        })
-
-        # Insert second reading: consume 0.8 kWh
-        db_helper.execute_stored_procedure("app.sp_InsertReading", {
-            "@AnalyzerID": analyzer_id,
-            "@KW_Total": 0.8,
-            "@KWh_Total": 10.8,
-            "@VL1": 230.5,
-            "@VL2": 231.2,
-            "@VL3": 228.9,
-            "@IL1": 4.2,
-            "@IL2": 4.1,
-            "@IL3": 4.0,
-            "@ITotal": 4.1,
-            "@Hz": 50.0,
-            "@PF_Avg": 0.95,
-            "@KWh_Grid": 10.8,
-            "@KWh_Generator": 0.0,
-            "@Quality": "GOOD"
-        })
+        # Baseline reading, then consume 0.8 kWh: both rows in one batch call
+        db_helper.execute_query("{CALL app.sp_InsertReadingsBatch(?)}", ([
+            _reading_row(1, analyzer_id, 0.5, 10.0, (230.0, 231.0, 229.5), (4.1, 4.0, 3.9), 4.0),
+            _reading_row(2, analyzer_id, 0.8, 10.8, (230.5, 231.2, 228.9), (4.2, 4.1, 4.0), 4.1),
+        ],))
 
         # Billing transaction should exist
         bill_rows = db_helper.execute_query(
-            "SELECT TOP 1 * FROM ops.BillingTransactions WHERE AnalyzerID = ? ORDER BY TransactionDate DESC",
+            "SELECT TOP 1 DeltaKWh FROM ops.BillingTransactions WHERE AnalyzerID = ? ORDER BY TransactionDate DESC",
             (analyzer_id,)
         )
         assert bill_rows is not None and len(bill_rows) >= 1
         assert bill_rows[0]["DeltaKWh"] >= 0
 
         # Insert third reading: consume to exhaustion (another 0.4 kWh)
-        db_helper.execute_stored_procedure("app.sp_InsertReading", {
-            "@AnalyzerID": analyzer_id,
-            "@KW_Total": 0.9,
-            "@KWh_Total": 11.2,
-            "@VL1": 231.0,
-            "@VL2": 231.5,
-            "@VL3": 229.1,
-            "@IL1": 4.4,
-            "@IL2": 4.2,
-            "@IL3": 4.0,
-            "@ITotal": 4.2,
-            "@Hz": 50.0,
-            "@PF_Avg": 0.95,
-            "@KWh_Grid": 11.2,
-            "@KWh_Generator": 0.0,
-            "@Quality": "GOOD"
-        })
-
-        # Verify alerts and email queue
-        alerts = db_helper.execute_query(
-            "SELECT TOP 5 * FROM app.Alerts WHERE UserID = ? ORDER BY TriggeredAt DESC",
+        db_helper.execute_query("{CALL app.sp_InsertReadingsBatch(?)}", ([
+            _reading_row(1, analyzer_id, 0.9, 11.2, (231.0, 231.5, 229.1), (4.4, 4.2, 4.0), 4.2),
+        ],))
+
+        # Verify alerts, and the user's lock state (may be locked when exhausted), in one query
+        user_row = db_helper.execute_query(
+            """
+            SELECT u.IsLocked,
+                   (SELECT COUNT(*) FROM app.Alerts a WHERE a.UserID = u.UserID) AS AlertCount
+            FROM app.Users u
+            WHERE u.UserID = ?
+            """,
             (user_id,)
         )
-        assert alerts is not None and len(alerts) >= 1
+        assert user_row is not None and user_row[0]["AlertCount"] >= 1
+        assert user_row[0]["IsLocked"] in (0, 1)
 
         try:
             emails = db_helper.execute_query(
@@ -143,9 +119,5 @@ def test_billing_and_alerts_flow():
             # EmailQueue may not exist or emails disabled; ignore
             pass
 
-        # User may be locked when exhausted
-        user_row = db_helper.execute_query("SELECT IsLocked FROM app.Users WHERE UserID = ?", (user_id,))
-        assert user_row is not None and user_row[0]["IsLocked"] in (0, 1)
-
     finally:
         _cleanup(user_id, analyzer_id)
@@ -1,24 +1,7 @@
 import json
-import os
-import sys
-from fastapi import FastAPI
-from fastapi.testclient import TestClient
 
-# Ensure backend package is importable in tests
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
-repo_root = os.path.join(project_root, "EnergyMonitoringSystem")
-backend_dir = os.path.join(repo_root, "backend")
-sys.path.insert(0, repo_root)
-sys.path.insert(0, backend_dir)
-
-from api.routes_admin import router as admin_router
-
-
-def test_admin_do_enqueue(monkeypatch):
-    app = FastAPI()
-    app.include_router(admin_router, prefix="/api/admin")
-    client = TestClient(app)
 
+def test_admin_do_enqueue(monkeypatch, admin_client, dependency_overrides):
     calls = {"sp": [], "audit": []}
 
     class DummyUser:
@@ -29,7 +12,7 @@ def test_admin_do_enqueue(monkeypatch):
         return DummyUser().data
 
     from backend.api.routes_auth import get_current_user as real_get_current_user
-    app.dependency_overrides[real_get_current_user] = fake_get_current_user
+    dependency_overrides[real_get_current_user] = fake_get_current_user
 
     def fake_sp(name, params):
         if name == "app.sp_ControlDigitalOutput":
@@ -44,7 +27,7 @@ def test_admin_do_enqueue(monkeypatch):
     monkeypatch.setattr(dbmod.db_helper, "execute_stored_procedure", fake_sp)
 
     body = {"analyzer_id": 7, "coil_address": 1, "command": "ON"}
-    resp = client.post("/api/admin/do/enqueue", json=body, headers={"Authorization": "Bearer test"})
+    resp = admin_client.post("/api/admin/do/enqueue", json=body, headers={"Authorization": "Bearer test"})
 
     assert resp.status_code == 200
     data = resp.json()
@@ -0,0 +1,30 @@
+from backend.dal import database
+
+
+class _FlakyCursor:
+    def __init__(self):
+        self.lookups = 0
+
+    def execute(self, query, *params):
+        self.lookups += 1
+        if self.lookups == 1:
+            raise RuntimeError("connection reset")
+
+    def fetchall(self):
+        return [("@AnalyzerID",), ("@Limit",)]
+
+
+def test_failed_signature_lookup_is_not_cached(monkeypatch):
+    monkeypatch.setattr(database, "_PROC_SIG", {})
+    monkeypatch.setattr(database, "_PROC_CALL", {})
+    cursor = _FlakyCursor()
+    names = ("@Limit", "@AnalyzerID")
+
+    sql, order = database.DatabaseHelper._proc_call(cursor, "app.sp_Test", names)
+    assert sql == "EXEC app.sp_Test @Limit = ?, @AnalyzerID = ?"
+    assert "app.sp_Test" not in database._PROC_SIG
+
+    sql, order = database.DatabaseHelper._proc_call(cursor, "app.sp_Test", names)
+    assert sql == "{CALL app.sp_Test(?, ?)}"
+    assert order == [1, 0]
+    assert cursor.lookups == 2
@@ -0,0 +1,66 @@
+import asyncio
+import socket
+
+from backend import do_worker as dw
+
+
+def _free_port():
+    # Bound then closed: nothing listens there, so connects are refused
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_refused_device_is_attempted_once(monkeypatch):
+    results = []
+    attempts = []
+    real_write = dw.write_do_0_async
+
+    async def counting_write(**kwargs):
+        attempts.append(kwargs)
+        return await real_write(**kwargs)
+
+    async def fc05_must_not_run(*args):
+        raise AssertionError("FC05 fallback tried against an unreachable device")
+
+    monkeypatch.setattr(dw, "_TEST_MODE", False)
+    monkeypatch.setattr(dw, "MODBUS_PORT", _free_port())
+    monkeypatch.setattr(dw, "write_do_0_async", counting_write)
+    monkeypatch.setattr(dw, "_fc05_write", fc05_must_not_run)
+    monkeypatch.setattr(dw, "_retry_delay", lambda attempt: 0)
+    monkeypatch.setattr(dw, "_update_result", lambda command_id, result, error=None: results.append((command_id, result, error)))
+    monkeypatch.setattr(dw, "_record_do_event", lambda *args, **kwargs: None)
+
+    # 127.0.0.2 is loopback but not treated as a simulated device
+    cmd = {"CommandID": 1, "AnalyzerID": 5, "IPAddress": "127.0.0.2", "ModbusID": 1,
+           "CoilAddress": 0, "Command": "ON", "MaxRetries": 3, "CurrentState": None}
+    asyncio.run(dw._execute_command(cmd))
+
+    assert len(attempts) == 1
+    assert [r[:2] for r in results] == [(1, "FAILED")]
+    assert "cannot connect" in results[0][2]
+
+
+def test_mixed_on_off_on_one_device_reads_back_per_command(monkeypatch):
+    results = []
+    device = {"state": 0}
+
+    async def fake_write(**kwargs):
+        # write_do_0_async always drives output 0, whatever the coil
+        device["state"] = kwargs["action"]
+        return True
+
+    monkeypatch.setattr(dw, "_TEST_MODE", False)
+    monkeypatch.setattr(dw, "write_do_0_async", fake_write)
+    monkeypatch.setattr(dw, "_read_status", lambda host, port, unit_id: device["state"])
+    monkeypatch.setattr(dw, "_update_result", lambda command_id, result, error=None: results.append((command_id, result)))
+    monkeypatch.setattr(dw, "_record_do_event", lambda *args, **kwargs: None)
+
+    base = {"AnalyzerID": 5, "IPAddress": "192.0.2.10", "ModbusID": 1, "MaxRetries": 1, "CurrentState": None}
+    cmds = [
+        {**base, "CommandID": 1, "CoilAddress": 0, "Command": "ON"},
+        {**base, "CommandID": 2, "CoilAddress": 1, "Command": "OFF"},
+    ]
+    asyncio.run(dw._safe_execute(cmds, asyncio.Semaphore(1)))
+
+    assert results == [(1, "SUCCESS"), (2, "SUCCESS")]
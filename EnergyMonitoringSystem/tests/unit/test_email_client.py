@@ -0,0 +1,23 @@
+from backend.utils import email_client
+
+
+class _FakeSMTP:
+    def __init__(self):
+        self.calls = []
+
+    def quit(self):
+        self.calls.append("quit")
+
+    def close(self):
+        self.calls.append("close")
+
+
+def test_close_quits_and_drops_the_shared_session(monkeypatch):
+    fake = _FakeSMTP()
+    monkeypatch.setattr(email_client, "_smtp", fake)
+
+    email_client.close()
+    email_client.close()
+
+    assert fake.calls == ["quit", "close"]
+    assert email_client._smtp is None
@@ -0,0 +1,16 @@
+from backend.utils.modbus_client import ModbusClient
+
+
+def test_single_glitch_does_not_change_word_order():
+    client = ModbusClient("192.0.2.1")
+    # Out of range in the Siemens order, so only a swapped order decodes it
+    client._decode_param("Voltage_L1_N", [9204, 24700], 2)
+    # The next, valid read must still be decoded in the Siemens order
+    assert round(client._decode_param("Voltage_L1_N", [26179, 128], 2), 3) == 230.5
+
+
+def test_order_is_promoted_after_consecutive_misses():
+    client = ModbusClient("192.0.2.1")
+    for _ in range(ModbusClient.ORDER_PROMOTE_AFTER):
+        client._decode_param("Voltage_L1_N", [9204, 24700], 2)
+    assert client._preferred_order["Voltage_L1_N"] != 0